@@ -1,20 +1,30 @@
 import asyncio
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 
-from .db import init_db
+from .db import engine, init_db
 from .routers import log, menu, progress, profile, report
 from .services.scheduler import shutdown_scheduler, start_scheduler
+from .services.user_cache import USER_CACHE_NOTIFY, listen_for_invalidations, user_cache
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
     start_scheduler()
+    listener = None
+    if USER_CACHE_NOTIFY:
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        listener = asyncio.create_task(listen_for_invalidations(dsn))
     try:
         yield
     finally:
+        if listener is not None:
+            listener.cancel()
+            # Дожидаемся задачи, чтобы соединение LISTEN закрылось до остановки цикла событий.
+            with suppress(asyncio.CancelledError):
+                await listener
         shutdown_scheduler()
 
 
@@ -29,3 +39,8 @@ app.include_router(report.router)
 @app.get("/health")
 async def healthcheck():
     return {"status": "ok"}
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"users": user_cache.stats()}
@@ -22,6 +22,8 @@ async_session_factory = async_sessionmaker(engine, expire_on_commit=False)
 async def init_db() -> None:
     async with engine.begin() as conn:
         await conn.run_sync(models.Base.metadata.create_all)
+        # create_all не добавляет индексы в уже существующие таблицы.
+        await conn.run_sync(models.DAILY_LOGS_USER_DATE_INDEX.create, checkfirst=True)
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
@@ -1,6 +1,6 @@
 from datetime import date, datetime
 
-from sqlalchemy import JSON, Column, Date, DateTime, Float, ForeignKey, Integer, Numeric, String, Text, UniqueConstraint
+from sqlalchemy import JSON, Column, Date, DateTime, Float, ForeignKey, Index, Integer, Numeric, String, Text, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
 
 
@@ -46,6 +46,47 @@ class DailyLog(Base):
     user = relationship("User", back_populates="daily_logs")
 
 
+# Покрывающий индекс сводки прогресса: последний день и среднее за неделю читаются index-only scan.
+DAILY_LOGS_USER_DATE_INDEX = Index(
+    "ix_daily_logs_user_date_desc",
+    DailyLog.user_id,
+    DailyLog.date.desc(),
+    postgresql_include=["calories_in", "weight_kg", "waist_cm", "hips_cm", "chest_cm"],
+)
+
+
+class LogAggregateColumns:
+    """Aggregates of the daily logs of one period; maintained by ``services.log_aggregates``."""
+
+    calories_sum = Column(Float, nullable=True)
+    calories_count = Column(Integer, nullable=False, default=0)
+    first_weight_kg = Column(Float, nullable=True)
+    last_weight_kg = Column(Float, nullable=True)
+    first_waist_cm = Column(Float, nullable=True)
+    last_waist_cm = Column(Float, nullable=True)
+    activity_count = Column(Integer, nullable=False, default=0)
+    low_activity_count = Column(Integer, nullable=False, default=0)
+
+
+class WeeklyLogAggregate(LogAggregateColumns, Base):
+    __tablename__ = "weekly_log_aggregates"
+    __table_args__ = (UniqueConstraint("user_id", "week_start", name="uq_weekly_log_aggregates_user_week"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Понедельник ISO-недели.
+    week_start = Column(Date, nullable=False)
+
+
+class RecentLogAggregate(LogAggregateColumns, Base):
+    __tablename__ = "recent_log_aggregates"
+
+    # Скользящее окно из 7 дней, по одной строке на пользователя.
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    window_start = Column(Date, nullable=False)
+    window_end = Column(Date, nullable=False)
+
+
 class WeeklyReport(Base):
     __tablename__ = "weekly_reports"
     __table_args__ = (UniqueConstraint("user_id", "week_start", name="uq_weekly_reports_user_week"),)
@@ -1,56 +1,222 @@
+import json
+import os
 from datetime import date
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import String, any_, bindparam, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
 from ..db import get_session
-from ..schemas import BodyLogRequest, DailyIntakeLogRequest
+from ..schemas import BodyLogRequest, BulkLogError, BulkLogResponse, BulkLogRow, DailyIntakeLogRequest
+from ..services.log_aggregates import logs_written
 
 
 router = APIRouter(prefix="/log", tags=["log"])
 
+BODY_FIELDS = ("weight_kg", "waist_cm", "hips_cm", "chest_cm")
+LOG_FIELDS = ("calories_in", *BODY_FIELDS)
 
-async def _get_user(session: AsyncSession, telegram_id: str) -> models.User:
-    result = await session.execute(select(models.User).where(models.User.telegram_id == telegram_id))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return user
+# Строк в одном многострочном INSERT: 7 параметров на строку (user_id, date и LOG_FIELDS),
+# лимит asyncpg — 32767; больше — каждый пакет молча уходил бы в запись по одной строке.
+BULK_BATCH_ROWS = max(1, min(int(os.getenv("CORE_BULK_BATCH_ROWS") or 1000), 32767 // (2 + len(LOG_FIELDS))))
+BULK_MAX_ROWS = int(os.getenv("CORE_BULK_MAX_ROWS") or 100000)
+BULK_MAX_BYTES = int(os.getenv("CORE_BULK_MAX_BYTES") or 64 * 1024 * 1024)
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def upsert_daily_log_stmt(telegram_id: str, log_date: date, values: Dict[str, Optional[float]]):
+    """INSERT ... SELECT FROM users ... ON CONFLICT (user_id, date) DO UPDATE for the given columns only.
+
+    The user is resolved inside the statement, so a write is one round trip
+    and concurrent writes for the same day cannot race on the unique key.
+    RETURNING gives ``daily_logs.user_id`` (the user's id, which the
+    aggregates refresh needs, not the log row's id), or no row when the user
+    does not exist. ``python -m core_api.scripts.check_log_upsert`` checks
+    both paths and concurrent writes against a real database.
+    """
+    daily_logs = models.DailyLog.__table__
+    columns = ["user_id", "date", *values]
+    source = select(
+        models.User.id,
+        literal(log_date, daily_logs.c.date.type),
+        *(literal(value, daily_logs.c[name].type) for name, value in values.items()),
+    ).where(models.User.telegram_id == telegram_id)
+    stmt = insert(daily_logs).from_select(columns, source)
+    # Без переданных полей строка дня всё равно должна существовать и вернуть id.
+    updates = {name: stmt.excluded[name] for name in values} or {"date": stmt.excluded.date}
+    return stmt.on_conflict_do_update(constraint="uq_daily_logs_user_date", set_=updates).returning(daily_logs.c.user_id)
 
 
-async def _get_or_create_daily_log(session: AsyncSession, user_id: int, log_date: date) -> models.DailyLog:
-    result = await session.execute(
-        select(models.DailyLog).where(models.DailyLog.user_id == user_id, models.DailyLog.date == log_date)
-    )
-    daily_log = result.scalars().first()
-    if daily_log is None:
-        daily_log = models.DailyLog(user_id=user_id, date=log_date)
-        session.add(daily_log)
-    return daily_log
+async def _upsert_daily_log(
+    session: AsyncSession, telegram_id: str, log_date: date, values: Dict[str, Optional[float]]
+) -> None:
+    result = await session.execute(upsert_daily_log_stmt(telegram_id, log_date, values))
+    user_id = result.scalar()
+    if user_id is None:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    await logs_written(session, [(user_id, log_date)])
+    await session.commit()
 
 
 @router.post("/daily-intake")
 async def log_daily_intake(payload: DailyIntakeLogRequest, session: AsyncSession = Depends(get_session)) -> dict:
-    user = await _get_user(session, payload.telegram_id)
-    daily_log = await _get_or_create_daily_log(session, user.id, payload.date)
-    daily_log.calories_in = payload.calories_in
-    await session.commit()
+    await _upsert_daily_log(session, payload.telegram_id, payload.date, {"calories_in": payload.calories_in})
     return {"status": "ok"}
 
 
 @router.post("/body")
 async def log_body_metrics(payload: BodyLogRequest, session: AsyncSession = Depends(get_session)) -> dict:
-    user = await _get_user(session, payload.telegram_id)
-    daily_log = await _get_or_create_daily_log(session, user.id, payload.date)
-    if payload.weight_kg is not None:
-        daily_log.weight_kg = payload.weight_kg
-    if payload.waist_cm is not None:
-        daily_log.waist_cm = payload.waist_cm
-    if payload.hips_cm is not None:
-        daily_log.hips_cm = payload.hips_cm
-    if payload.chest_cm is not None:
-        daily_log.chest_cm = payload.chest_cm
-    await session.commit()
+    values = {name: getattr(payload, name) for name in BODY_FIELDS if getattr(payload, name) is not None}
+    await _upsert_daily_log(session, payload.telegram_id, payload.date, values)
     return {"status": "ok"}
+
+
+def upsert_daily_logs_stmt(rows: List[Dict[str, object]]):
+    """Multi-row INSERT ... ON CONFLICT (user_id, date) DO UPDATE.
+
+    Every row carries ``user_id``, ``date`` and all of ``LOG_FIELDS``; a None
+    field means "not sent" and keeps the stored value. Rows must not repeat
+    a (user_id, date) pair: Postgres refuses to update one row twice in a
+    statement.
+    """
+    daily_logs = models.DailyLog.__table__
+    stmt = insert(daily_logs).values(rows)
+    updates = {name: func.coalesce(stmt.excluded[name], daily_logs.c[name]) for name in LOG_FIELDS}
+    return stmt.on_conflict_do_update(constraint="uq_daily_logs_user_date", set_=updates)
+
+
+def _parse_line(line: bytes) -> object:
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Некорректный JSON: {e}")
+
+
+async def _capped_stream(request: Request) -> AsyncIterator[bytes]:
+    too_large = HTTPException(status_code=413, detail=f"Тело запроса больше {BULK_MAX_BYTES} байт")
+    try:
+        expected = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        expected = 0
+    # Заявленную длину проверяем до чтения; без неё считаем принятые байты.
+    if expected > BULK_MAX_BYTES:
+        raise too_large
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > BULK_MAX_BYTES:
+            raise too_large
+        yield chunk
+
+
+async def _read_bulk_rows(request: Request) -> List[object]:
+    """Raw rows of a JSON array or an NDJSON stream; an unparsable NDJSON line becomes a ValueError row."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        rows: List[object] = []
+        buffer = b""
+        async for chunk in _capped_stream(request):
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            rows.extend(_parse_line(line) for line in lines if line.strip())
+            if len(rows) > BULK_MAX_ROWS:
+                raise HTTPException(status_code=413, detail=f"Больше {BULK_MAX_ROWS} строк в одном запросе")
+        if buffer.strip():
+            rows.append(_parse_line(buffer))
+        return rows
+    try:
+        rows = json.loads(b"".join([chunk async for chunk in _capped_stream(request)]))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный JSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Ожидается JSON-массив строк")
+    if len(rows) > BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Больше {BULK_MAX_ROWS} строк в одном запросе")
+    return rows
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc']) or 'row'}: {e['msg']}" for e in error.errors())
+
+
+async def _resolve_users(session: AsyncSession, telegram_ids: List[str]) -> Dict[str, int]:
+    if not telegram_ids:
+        return {}
+    ids = bindparam("telegram_ids", telegram_ids, type_=ARRAY(String))
+    result = await session.execute(select(models.User.telegram_id, models.User.id).where(models.User.telegram_id == any_(ids)))
+    return dict(result.all())
+
+
+@router.post("/bulk", response_model=BulkLogResponse)
+async def log_bulk(request: Request, session: AsyncSession = Depends(get_session)) -> BulkLogResponse:
+    """Intake and body rows of many users: a JSON array or NDJSON (``application/x-ndjson``).
+
+    A row is ``{"telegram_id", "date", "calories_in"?, "weight_kg"?, "waist_cm"?,
+    "hips_cm"?, "chest_cm"?}``; only the sent fields are written and later rows
+    for the same user and day win. Rows that fail validation, name an unknown
+    user or are rejected by the database are reported by index in ``errors``;
+    the rest of the batch is written.
+    """
+    raw_rows = await _read_bulk_rows(request)
+    errors: List[BulkLogError] = []
+    valid: List[Tuple[int, BulkLogRow]] = []
+    for index, raw in enumerate(raw_rows):
+        if isinstance(raw, ValueError):
+            errors.append(BulkLogError(index=index, error=str(raw)))
+            continue
+        try:
+            valid.append((index, BulkLogRow.model_validate(raw)))
+        except ValidationError as e:
+            errors.append(BulkLogError(index=index, error=_validation_message(e)))
+
+    user_ids = await _resolve_users(session, list({row.telegram_id for _, row in valid}))
+
+    # Повторы одного дня сливаются заранее: ON CONFLICT не обновит строку дважды за оператор.
+    merged: Dict[Tuple[int, date], Dict[str, object]] = {}
+    sources: Dict[Tuple[int, date], List[int]] = {}
+    for index, row in valid:
+        user_id = user_ids.get(row.telegram_id)
+        if user_id is None:
+            errors.append(BulkLogError(index=index, error="Пользователь не найден"))
+            continue
+        key = (user_id, row.date)
+        values = merged.setdefault(key, {"user_id": user_id, "date": row.date, **dict.fromkeys(LOG_FIELDS)})
+        for name in LOG_FIELDS:
+            if getattr(row, name) is not None:
+                values[name] = getattr(row, name)
+        sources.setdefault(key, []).append(index)
+
+    keys = list(merged)
+    written = 0
+    written_keys: List[Tuple[int, date]] = []
+    for start in range(0, len(keys), BULK_BATCH_ROWS):
+        batch = keys[start : start + BULK_BATCH_ROWS]
+        try:
+            async with session.begin_nested():
+                await session.execute(upsert_daily_logs_stmt([merged[key] for key in batch]))
+            written += sum(len(sources[key]) for key in batch)
+            written_keys.extend(batch)
+            continue
+        except DBAPIError:
+            pass
+        # Пакет отклонён целиком: пишем его строки по одной, чтобы найти виноватые.
+        for key in batch:
+            try:
+                async with session.begin_nested():
+                    await session.execute(upsert_daily_logs_stmt([merged[key]]))
+                written += len(sources[key])
+                written_keys.append(key)
+            except DBAPIError as e:
+                # Драйвер asyncpg предваряет текст ошибки именем класса: "<class '...'>: текст".
+                message = str(e.orig).strip().splitlines()[0].split(">: ", 1)[-1]
+                errors.extend(BulkLogError(index=index, error=message) for index in sources[key])
+    await logs_written(session, written_keys)
+    await session.commit()
+
+    errors.sort(key=lambda error: error.index)
+    return BulkLogResponse(received=len(raw_rows), written=written, errors=errors)
@@ -3,7 +3,7 @@ from datetime import date, timedelta
 from fastapi import APIRouter, Depends, HTTPException
 from datetime import date, timedelta
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -12,19 +12,12 @@ from ..db import get_session
 from ..schemas import MenuPlanResponse
 from ..services.calorie_calc import calculate_daily_calories
 from ..services.menu_generator import generate_week_menu
+from ..services.user_cache import get_user
 
 
 router = APIRouter(prefix="/menu", tags=["menu"])
 
 
-async def _get_user(session: AsyncSession, telegram_id: str) -> models.User:
-    result = await session.execute(select(models.User).where(models.User.telegram_id == telegram_id))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return user
-
-
 def _current_week_range(today: date) -> tuple[date, date]:
     week_start = today - timedelta(days=today.weekday())
     week_end = week_start + timedelta(days=6)
@@ -33,7 +26,7 @@ def _current_week_range(today: date) -> tuple[date, date]:
 
 @router.get("/week", response_model=MenuPlanResponse)
 async def get_week_menu(telegram_id: str, session: AsyncSession = Depends(get_session)) -> MenuPlanResponse:
-    user = await _get_user(session, telegram_id)
+    user = await get_user(session, telegram_id)
     today = date.today()
     week_start, week_end = _current_week_range(today)
 
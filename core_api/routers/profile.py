@@ -6,6 +6,7 @@ from .. import models
 from ..db import get_session
 from ..schemas import ProfileInitRequest, ProfileInitResponse
 from ..services.calorie_calc import calculate_daily_calories
+from ..services.user_cache import CachedUser, profile_changed, user_cache
 
 
 router = APIRouter(prefix="/profile", tags=["profile"])
@@ -44,8 +45,11 @@ async def init_profile(payload: ProfileInitRequest, session: AsyncSession = Depe
         user.chronic_conditions = payload.chronic_conditions or None
         user.activity_level = payload.activity_level
 
+    await profile_changed(session, payload.telegram_id)
     await session.commit()
     await session.refresh(user)
+    user_cache.invalidate(payload.telegram_id)
+    user_cache.put(CachedUser.from_model(user))
 
     calc_result = calculate_daily_calories(
         weight_kg=payload.weight_kg,
@@ -1,53 +1,59 @@
-from datetime import date, timedelta
+from datetime import date
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy import select
+from fastapi import APIRouter, Depends
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models
 from ..db import get_session
 from ..schemas import ProgressSummary
 from ..services.calorie_calc import calculate_daily_calories
+from ..services.log_aggregates import window_start_of
+from ..services.user_cache import get_user
 
 
 router = APIRouter(prefix="/progress", tags=["progress"])
 
 
-async def _get_user(session: AsyncSession, telegram_id: str) -> models.User:
-    result = await session.execute(select(models.User).where(models.User.telegram_id == telegram_id))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return user
+def progress_summary_stmt(user_id: int, today: date):
+    """Latest day's measurements plus the average intake of the seven days ending ``today`` in one row.
 
-
-@router.get("/summary", response_model=ProgressSummary)
-async def progress_summary(telegram_id: str, session: AsyncSession = Depends(get_session)) -> ProgressSummary:
-    user = await _get_user(session, telegram_id)
-    today = date.today()
-    week_start = today - timedelta(days=6)
-
-    logs_result = await session.execute(
-        select(models.DailyLog)
-        .where(models.DailyLog.user_id == user.id)
-        .where(models.DailyLog.date >= week_start)
-        .order_by(models.DailyLog.date)
+    The average comes from the user's ``recent_log_aggregates`` row; only
+    when that window is stale (no write since the day changed and the nightly
+    roll has not run yet) does Postgres evaluate the fallback, a scan of
+    one week of ``ix_daily_logs_user_date_desc``. The latest day is the first
+    index entry for the user.
+    """
+    daily_logs = models.DailyLog.__table__
+    recent = models.RecentLogAggregate.__table__
+    stored_avg = (
+        select(recent.c.calories_sum / func.nullif(recent.c.calories_count, 0))
+        .where(recent.c.user_id == user_id, recent.c.window_end == today)
+        .scalar_subquery()
     )
-    logs = logs_result.scalars().all()
+    week_avg = (
+        select(func.avg(daily_logs.c.calories_in))
+        .where(daily_logs.c.user_id == user_id, daily_logs.c.date >= window_start_of(today), daily_logs.c.date <= today)
+        .scalar_subquery()
+    )
+    latest = (
+        select(daily_logs.c.weight_kg, daily_logs.c.waist_cm, daily_logs.c.hips_cm, daily_logs.c.chest_cm)
+        .where(daily_logs.c.user_id == user_id)
+        .order_by(daily_logs.c.date.desc())
+        .limit(1)
+        .subquery("latest")
+    )
+    return select(latest, func.coalesce(stored_avg, week_avg).label("avg_calories"))
 
-    last_log = logs[-1] if logs else None
-    if not last_log:
-        latest_log_result = await session.execute(
-            select(models.DailyLog)
-            .where(models.DailyLog.user_id == user.id)
-            .order_by(models.DailyLog.date.desc())
-        )
-        last_log = latest_log_result.scalars().first()
 
+@router.get("/summary", response_model=ProgressSummary)
+async def progress_summary(telegram_id: str, session: AsyncSession = Depends(get_session)) -> ProgressSummary:
+    user = await get_user(session, telegram_id)
+    # Нет ни одной записи — нет и строки результата.
+    last_log = (await session.execute(progress_summary_stmt(user.id, date.today()))).first()
     avg_calories = None
-    calorie_values = [log.calories_in for log in logs if log.calories_in is not None]
-    if calorie_values:
-        avg_calories = round(sum(calorie_values) / len(calorie_values), 1)
+    if last_log and last_log.avg_calories is not None:
+        avg_calories = round(last_log.avg_calories, 1)
 
     weight_for_calc = last_log.weight_kg if last_log and last_log.weight_kg else user.start_weight_kg
     target_calories = calculate_daily_calories(
@@ -7,19 +7,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models
 from ..db import get_session
 from ..schemas import WeeklyReportResponse
+from ..services.user_cache import get_user
 
 
 router = APIRouter(prefix="/report", tags=["report"])
 
 
-async def _get_user(session: AsyncSession, telegram_id: str) -> models.User:
-    result = await session.execute(select(models.User).where(models.User.telegram_id == telegram_id))
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-    return user
-
-
 def _empty_report_response() -> WeeklyReportResponse:
     today = date.today()
     week_start = today - timedelta(days=today.weekday())
@@ -35,7 +28,7 @@ def _empty_report_response() -> WeeklyReportResponse:
 @router.get("/weekly", response_model=WeeklyReportResponse)
 async def get_weekly_report(telegram_id: str, session: AsyncSession = Depends(get_session)) -> WeeklyReportResponse:
     try:
-        user = await _get_user(session, telegram_id)
+        user = await get_user(session, telegram_id)
     except HTTPException as exc:
         if exc.status_code == 404:
             return _empty_report_response()
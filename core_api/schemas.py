@@ -38,6 +38,27 @@ class BodyLogRequest(BaseModel):
     chest_cm: Optional[float] = None
 
 
+class BulkLogRow(BaseModel):
+    telegram_id: str
+    date: date
+    calories_in: Optional[float] = None
+    weight_kg: Optional[float] = None
+    waist_cm: Optional[float] = None
+    hips_cm: Optional[float] = None
+    chest_cm: Optional[float] = None
+
+
+class BulkLogError(BaseModel):
+    index: int
+    error: str
+
+
+class BulkLogResponse(BaseModel):
+    received: int
+    written: int
+    errors: List[BulkLogError]
+
+
 class ProgressSummary(BaseModel):
     last_weight_kg: Optional[float]
     last_waist_cm: Optional[float]
@@ -0,0 +1,115 @@
+"""Concurrency check and latency of daily-log writes: select-then-insert versus one upsert.
+
+Usage: python -m core_api.scripts.bench_log_upsert [--writes 500] [--concurrency 20]
+
+Needs the database from POSTGRES_* variables. Creates a throwaway user,
+removes it afterwards.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Awaitable, Callable, List
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from ..db import async_session_factory, init_db
+from ..models import DailyLog, User
+from ..routers.log import upsert_daily_log_stmt
+from ..services.log_aggregates import logs_written
+
+
+WriteFn = Callable[[str, date, float], Awaitable[None]]
+
+
+async def write_before(telegram_id: str, log_date: date, calories: float) -> None:
+    # Прежний путь: поиск пользователя, поиск строки дня, INSERT или UPDATE при коммите.
+    async with async_session_factory() as session:
+        user = (await session.execute(select(User).where(User.telegram_id == telegram_id))).scalars().first()
+        daily_log = (
+            await session.execute(select(DailyLog).where(DailyLog.user_id == user.id, DailyLog.date == log_date))
+        ).scalars().first()
+        if daily_log is None:
+            daily_log = DailyLog(user_id=user.id, date=log_date)
+            session.add(daily_log)
+        daily_log.calories_in = calories
+        await session.commit()
+
+
+async def write_after(telegram_id: str, log_date: date, calories: float) -> None:
+    async with async_session_factory() as session:
+        result = await session.execute(upsert_daily_log_stmt(telegram_id, log_date, {"calories_in": calories}))
+        await logs_written(session, [(result.scalar(), log_date)])
+        await session.commit()
+
+
+async def _race(write: WriteFn, telegram_id: str, log_date: date, concurrency: int) -> dict:
+    """``concurrency`` simultaneous first writes of the same day."""
+    results = await asyncio.gather(
+        *(write(telegram_id, log_date, 1000.0 + i) for i in range(concurrency)), return_exceptions=True
+    )
+    conflicts = sum(isinstance(r, IntegrityError) for r in results)
+    other = [r for r in results if isinstance(r, Exception) and not isinstance(r, IntegrityError)]
+    if other:
+        raise other[0]
+    async with async_session_factory() as session:
+        rows = (
+            await session.execute(
+                select(func.count()).select_from(DailyLog).join(User).where(User.telegram_id == telegram_id, DailyLog.date == log_date)
+            )
+        ).scalar()
+    return {"failed_writes": conflicts, "rows": rows}
+
+
+async def _latency(write: WriteFn, telegram_id: str, start: date, writes: int) -> dict:
+    timings: List[float] = []
+    for i in range(writes):
+        # Половина записей создаёт новый день, половина обновляет существующий.
+        log_date = start + timedelta(days=i // 2)
+        started = time.perf_counter()
+        await write(telegram_id, log_date, 1500.0 + i)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        "mean_ms": round(statistics.fmean(timings), 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5, help="повторов гонки за один день")
+    args = parser.parse_args()
+
+    await init_db()
+    telegram_id = f"bench-{uuid.uuid4().hex[:12]}"
+    async with async_session_factory() as session:
+        session.add(User(
+            telegram_id=telegram_id, age=30, sex="f", height_cm=170, start_weight_kg=70,
+            target_weight_kg=65, activity_level="moderate",
+        ))
+        await session.commit()
+    try:
+        for name, write, base in (("before", write_before, date(2000, 1, 1)), ("after", write_after, date(2010, 1, 1))):
+            races = [await _race(write, telegram_id, base - timedelta(days=r + 1), args.concurrency) for r in range(args.rounds)]
+            latency = await _latency(write, telegram_id, base, args.writes)
+            print(
+                f"{name:>6}: failed concurrent writes {sum(r['failed_writes'] for r in races)}/{args.rounds * args.concurrency}, "
+                f"rows per day {sorted({r['rows'] for r in races})}, "
+                f"latency p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, mean {latency['mean_ms']} ms"
+            )
+    finally:
+        async with async_session_factory() as session:
+            await session.execute(delete(User).where(User.telegram_id == telegram_id))
+            await session.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""Database check of the single-day log upsert behind POST /log/daily-intake and /log/body.
+
+Usage: python -m core_api.scripts.check_log_upsert [--concurrency 20]
+
+Needs the database from POSTGRES_* variables. Creates a throwaway user,
+removes it afterwards. Prints one line per check and exits with status 1
+if any of them fails.
+"""
+
+import argparse
+import asyncio
+import uuid
+from datetime import date
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, select
+
+from ..db import async_session_factory, init_db
+from ..models import DailyLog, User, WeeklyLogAggregate
+from ..routers.log import _upsert_daily_log, upsert_daily_log_stmt
+from ..services.log_aggregates import week_start_of
+
+
+DAY = date(2001, 1, 3)
+RACE_DAY = date(2001, 1, 4)
+
+
+async def _write(telegram_id: str, log_date: date, values: Dict[str, float]) -> None:
+    async with async_session_factory() as session:
+        await _upsert_daily_log(session, telegram_id, log_date, values)
+
+
+async def _day_rows(user_id: int, log_date: date) -> List[DailyLog]:
+    async with async_session_factory() as session:
+        result = await session.execute(select(DailyLog).where(DailyLog.user_id == user_id, DailyLog.date == log_date))
+        return list(result.scalars())
+
+
+async def _run_checks(telegram_id: str, user_id: int, concurrency: int) -> List[Tuple[str, bool, str]]:
+    checks: List[Tuple[str, bool, str]] = []
+
+    def check(name: str, ok: bool, detail: object = "") -> None:
+        checks.append((name, ok, str(detail)))
+
+    # Неизвестный пользователь: запрос не возвращает строк, эндпоинт отвечает 404 и ничего не пишет.
+    missing = f"missing-{uuid.uuid4().hex[:12]}"
+    async with async_session_factory() as session:
+        rows = (await session.execute(upsert_daily_log_stmt(missing, DAY, {"calories_in": 1.0}))).all()
+        await session.rollback()
+    check("unknown user: no RETURNING row", rows == [], rows)
+    try:
+        await _write(missing, DAY, {"calories_in": 1.0})
+        check("unknown user: 404", False, "no exception")
+    except HTTPException as e:
+        check("unknown user: 404", e.status_code == 404, e.status_code)
+    async with async_session_factory() as session:
+        orphans = (await session.execute(select(func.count()).select_from(DailyLog).where(DailyLog.date == DAY))).scalar()
+    check("unknown user: nothing written", orphans == 0, orphans)
+
+    # Существующий пользователь: RETURNING отдаёт его id, обновляются только переданные поля.
+    async with async_session_factory() as session:
+        returned = (await session.execute(upsert_daily_log_stmt(telegram_id, DAY, {"calories_in": 1800.0}))).scalar()
+        await session.commit()
+    check("returns users.id", returned == user_id, returned)
+    await _write(telegram_id, DAY, {"weight_kg": 70.5})
+    await _write(telegram_id, DAY, {})
+    rows = await _day_rows(user_id, DAY)
+    kept = len(rows) == 1 and rows[0].calories_in == 1800.0 and rows[0].weight_kg == 70.5
+    check("partial writes keep other fields", kept, [(r.calories_in, r.weight_kg) for r in rows])
+
+    # Одновременные первые записи одного дня: ни одна не падает, строка одна.
+    results = await asyncio.gather(
+        *(_write(telegram_id, RACE_DAY, {"calories_in": 1000.0 + i}) for i in range(concurrency)), return_exceptions=True
+    )
+    failed = [repr(r) for r in results if isinstance(r, Exception)]
+    check(f"{concurrency} concurrent writes succeed", not failed, failed[:3])
+    rows = await _day_rows(user_id, RACE_DAY)
+    check("one row per day", len(rows) == 1, len(rows))
+    async with async_session_factory() as session:
+        weekly = (
+            await session.execute(
+                select(WeeklyLogAggregate).where(
+                    WeeklyLogAggregate.user_id == user_id, WeeklyLogAggregate.week_start == week_start_of(RACE_DAY)
+                )
+            )
+        ).scalars().first()
+    # Сводка недели должна видеть оба дня и последнее записанное значение.
+    expected = 1800.0 + (rows[0].calories_in if rows else 0)
+    consistent = weekly is not None and weekly.calories_count == 2 and weekly.calories_sum == expected
+    check("weekly aggregate matches logs", consistent, weekly and (weekly.calories_count, weekly.calories_sum))
+    return checks
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    await init_db()
+    telegram_id = f"check-{uuid.uuid4().hex[:12]}"
+    async with async_session_factory() as session:
+        user = User(
+            telegram_id=telegram_id, age=30, sex="f", height_cm=170, start_weight_kg=70,
+            target_weight_kg=65, activity_level="moderate",
+        )
+        session.add(user)
+        await session.commit()
+        user_id = user.id
+    try:
+        checks = await _run_checks(telegram_id, user_id, args.concurrency)
+    finally:
+        async with async_session_factory() as session:
+            await session.execute(delete(User).where(User.telegram_id == telegram_id))
+            await session.commit()
+    for name, ok, detail in checks:
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + ("" if ok else f": {detail}"))
+    if not all(ok for _, ok, _ in checks):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,40 @@
+"""Rebuild weekly and trailing-window log aggregates from daily_logs.
+
+Usage: python -m core_api.scripts.rebuild_aggregates [--telegram-id ID ...]
+
+Without --telegram-id every user is rebuilt in one transaction. Needed only
+for repair: log writes keep the aggregates current on their own.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import func, select
+
+from ..db import async_session_factory, init_db
+from ..models import RecentLogAggregate, User, WeeklyLogAggregate
+from ..services.log_aggregates import rebuild_aggregates
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--telegram-id", action="append", help="только этот пользователь (можно несколько раз)")
+    args = parser.parse_args()
+
+    await init_db()
+    async with async_session_factory() as session:
+        user_ids = None
+        if args.telegram_id:
+            result = await session.execute(select(User.id).where(User.telegram_id.in_(args.telegram_id)))
+            user_ids = list(result.scalars())
+            if len(user_ids) != len(set(args.telegram_id)):
+                raise SystemExit("Не все пользователи найдены")
+        await rebuild_aggregates(session, user_ids)
+        await session.commit()
+        weeks = (await session.execute(select(func.count()).select_from(WeeklyLogAggregate))).scalar()
+        windows = (await session.execute(select(func.count()).select_from(RecentLogAggregate))).scalar()
+    print(f"weekly rows: {weeks}, trailing windows: {windows}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
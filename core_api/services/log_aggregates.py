@@ -0,0 +1,208 @@
+from dataclasses import dataclass, fields
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import RecentLogAggregate, WeeklyLogAggregate
+
+
+WINDOW_DAYS = 7
+AGGREGATE_FIELDS = (
+    "calories_sum",
+    "calories_count",
+    "first_weight_kg",
+    "last_weight_kg",
+    "first_waist_cm",
+    "last_waist_cm",
+    "activity_count",
+    "low_activity_count",
+)
+
+
+@dataclass(frozen=True)
+class PeriodAggregate:
+    """Calories, first/last weight and waist, activity counts of one period."""
+
+    calories_sum: Optional[float] = None
+    calories_count: int = 0
+    first_weight_kg: Optional[float] = None
+    last_weight_kg: Optional[float] = None
+    first_waist_cm: Optional[float] = None
+    last_waist_cm: Optional[float] = None
+    activity_count: int = 0
+    low_activity_count: int = 0
+
+    @classmethod
+    def from_row(cls, row) -> "PeriodAggregate":
+        return cls(**{field.name: getattr(row, field.name) for field in fields(cls)})
+
+    @property
+    def avg_calories(self) -> Optional[float]:
+        return round(self.calories_sum / self.calories_count, 1) if self.calories_count else None
+
+    @property
+    def weight_change(self) -> Optional[float]:
+        return _change(self.first_weight_kg, self.last_weight_kg)
+
+    @property
+    def waist_change(self) -> Optional[float]:
+        return _change(self.first_waist_cm, self.last_waist_cm)
+
+
+def _change(first: Optional[float], last: Optional[float]) -> Optional[float]:
+    if first is None or last is None:
+        return None
+    return round(last - first, 1)
+
+
+def week_start_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def window_start_of(today: date) -> date:
+    return today - timedelta(days=WINDOW_DAYS - 1)
+
+
+# Одни и те же выражения для хранимых строк и для прямого пересчёта периода.
+# Пустая отметка активности не считается, как и отсутствующая.
+_AGGREGATES_SQL = """
+    sum(d.calories_in) AS calories_sum,
+    count(d.calories_in) AS calories_count,
+    (array_agg(d.weight_kg ORDER BY d.date) FILTER (WHERE d.weight_kg IS NOT NULL))[1] AS first_weight_kg,
+    (array_agg(d.weight_kg ORDER BY d.date DESC) FILTER (WHERE d.weight_kg IS NOT NULL))[1] AS last_weight_kg,
+    (array_agg(d.waist_cm ORDER BY d.date) FILTER (WHERE d.waist_cm IS NOT NULL))[1] AS first_waist_cm,
+    (array_agg(d.waist_cm ORDER BY d.date DESC) FILTER (WHERE d.waist_cm IS NOT NULL))[1] AS last_waist_cm,
+    count(d.activity_level) FILTER (WHERE d.activity_level <> '') AS activity_count,
+    count(d.activity_level) FILTER (WHERE d.activity_level = 'low') AS low_activity_count
+"""
+_UPDATE_SQL = ", ".join(f"{name} = excluded.{name}" for name in AGGREGATE_FIELDS)
+
+# Ключи пересчёта: затронутые записью пары (пользователь, неделя) и пользователи.
+TOUCHED_WEEKS = "unnest(CAST(:user_ids AS integer[]), CAST(:week_starts AS date[])) AS k(user_id, week_start)"
+TOUCHED_USERS = "unnest(CAST(:user_ids AS integer[])) AS k(user_id)"
+
+
+def refresh_weeks_sql(keys: str) -> str:
+    """Recompute ``weekly_log_aggregates`` for ``keys``, a FROM item ``k(user_id, week_start)``.
+
+    Each key reads at most seven daily logs through the (user_id, date) index.
+    """
+    return f"""
+        INSERT INTO weekly_log_aggregates (user_id, week_start, {", ".join(AGGREGATE_FIELDS)})
+        SELECT k.user_id, k.week_start, {_AGGREGATES_SQL}
+        FROM {keys}
+        LEFT JOIN daily_logs AS d
+            ON d.user_id = k.user_id AND d.date >= k.week_start AND d.date < k.week_start + 7
+        GROUP BY k.user_id, k.week_start
+        ON CONFLICT (user_id, week_start) DO UPDATE SET {_UPDATE_SQL}
+    """
+
+
+def refresh_windows_sql(keys: str) -> str:
+    """Recompute ``recent_log_aggregates`` for ``keys``, a FROM item ``k(user_id)``, on [:window_start, :window_end]."""
+    return f"""
+        INSERT INTO recent_log_aggregates (user_id, window_start, window_end, {", ".join(AGGREGATE_FIELDS)})
+        SELECT k.user_id, CAST(:window_start AS date), CAST(:window_end AS date), {_AGGREGATES_SQL}
+        FROM {keys}
+        LEFT JOIN daily_logs AS d
+            ON d.user_id = k.user_id AND d.date >= CAST(:window_start AS date) AND d.date <= CAST(:window_end AS date)
+        GROUP BY k.user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            window_start = excluded.window_start, window_end = excluded.window_end, {_UPDATE_SQL}
+    """
+
+
+# postgresql.insert() SQLAlchemy не кэширует и компилирует заново на каждой записи; text() собирается один раз.
+LOCK_USERS = text("SELECT id FROM users WHERE id = ANY(CAST(:user_ids AS integer[])) ORDER BY id FOR NO KEY UPDATE")
+REFRESH_TOUCHED_WEEKS = text(refresh_weeks_sql(TOUCHED_WEEKS))
+REFRESH_TOUCHED_WINDOWS = text(refresh_windows_sql(TOUCHED_USERS))
+ROLL_WINDOWS = text(
+    refresh_windows_sql("(SELECT user_id FROM recent_log_aggregates WHERE window_end < CAST(:window_end AS date)) AS k")
+)
+PERIOD_AGGREGATE = text(
+    f"SELECT {_AGGREGATES_SQL} FROM daily_logs AS d WHERE d.user_id = :user_id AND d.date >= :start AND d.date <= :end"
+)
+
+
+def _window(today: date) -> Dict[str, date]:
+    return {"window_start": window_start_of(today), "window_end": today}
+
+
+async def logs_written(session: AsyncSession, days: Iterable[Tuple[int, date]], today: Optional[date] = None) -> None:
+    """Bring the aggregates in line after writing the (user_id, date) daily logs ``days``.
+
+    Call inside the transaction of the write. Cost depends on the number of
+    touched weeks and users, not on the length of their history.
+    """
+    weeks = sorted({(user_id, week_start_of(day)) for user_id, day in days})
+    if not weeks:
+        return
+    user_ids = sorted({user_id for user_id, _ in weeks})
+    # Пересчёт по снимку без чужой незакоммиченной записи потерял бы её день:
+    # записи одного пользователя сериализуются блокировкой его строки в users.
+    await session.execute(LOCK_USERS, {"user_ids": user_ids})
+    await session.execute(
+        REFRESH_TOUCHED_WEEKS,
+        {"user_ids": [user_id for user_id, _ in weeks], "week_starts": [week_start for _, week_start in weeks]},
+    )
+    await session.execute(REFRESH_TOUCHED_WINDOWS, {"user_ids": user_ids, **_window(today or date.today())})
+
+
+async def roll_recent_aggregates(session: AsyncSession, today: Optional[date] = None) -> None:
+    """Move every stale trailing window to end on ``today``; the nightly job runs this."""
+    await session.execute(ROLL_WINDOWS, _window(today or date.today()))
+
+
+async def rebuild_aggregates(session: AsyncSession, user_ids: Optional[Iterable[int]] = None, today: Optional[date] = None) -> None:
+    """Recompute all aggregates (of ``user_ids`` only, if given) from ``daily_logs``."""
+    params: Dict[str, object] = _window(today or date.today())
+    where = ""
+    if user_ids is not None:
+        params["user_ids"] = list(user_ids)
+        where = "WHERE {column} = ANY(CAST(:user_ids AS integer[]))"
+    weeks = (
+        "(SELECT DISTINCT user_id, CAST(date_trunc('week', date) AS date) AS week_start "
+        f"FROM daily_logs {where.format(column='user_id')}) AS k"
+    )
+    users = f"(SELECT id AS user_id FROM users {where.format(column='id')}) AS k"
+    await session.execute(text(f"DELETE FROM weekly_log_aggregates {where.format(column='user_id')}"), params)
+    await session.execute(text(refresh_weeks_sql(weeks)), params)
+    await session.execute(text(refresh_windows_sql(users)), params)
+
+
+async def recent_window(session: AsyncSession, user_id: int, today: Optional[date] = None) -> PeriodAggregate:
+    """The trailing seven days ending ``today``; a stale window is recomputed from at most seven logs."""
+    today = today or date.today()
+    result = await session.execute(
+        select(RecentLogAggregate).where(RecentLogAggregate.user_id == user_id, RecentLogAggregate.window_end == today)
+    )
+    row = result.scalars().first()
+    if row is not None:
+        return PeriodAggregate.from_row(row)
+    return await aggregate_period(session, user_id, window_start_of(today), today)
+
+
+async def period_aggregate(session: AsyncSession, user_id: int, start: date, end: date) -> PeriodAggregate:
+    """Aggregates of [start, end]: a stored row for the trailing window or an ISO week, otherwise computed from the logs.
+
+    A week without a stored row is computed from its at most seven logs too:
+    rows are only written for weeks touched since the aggregates appeared.
+    """
+    if end == date.today() and start == window_start_of(end):
+        return await recent_window(session, user_id, end)
+    if start == week_start_of(start) and end == start + timedelta(days=6):
+        result = await session.execute(
+            select(WeeklyLogAggregate).where(WeeklyLogAggregate.user_id == user_id, WeeklyLogAggregate.week_start == start)
+        )
+        row = result.scalars().first()
+        if row is not None:
+            return PeriodAggregate.from_row(row)
+    return await aggregate_period(session, user_id, start, end)
+
+
+async def aggregate_period(session: AsyncSession, user_id: int, start: date, end: date) -> PeriodAggregate:
+    """Aggregates of [start, end] straight from ``daily_logs``, with the same SQL the stored rows use."""
+    result = await session.execute(PERIOD_AGGREGATE, {"user_id": user_id, "start": start, "end": end})
+    return PeriodAggregate.from_row(result.one())
@@ -5,6 +5,7 @@ from sqlalchemy import select, func
 
 from ..db import async_session_factory
 from ..models import DailyLog, User, WeeklyReport
+from .log_aggregates import roll_recent_aggregates
 from .report_generator import generate_weekly_report
 
 
@@ -35,9 +36,17 @@ async def generate_reports_job() -> None:
                 await generate_weekly_report(session, user, week_start, week_end)
 
 
+async def roll_aggregates_job() -> None:
+    async with async_session_factory() as session:
+        await roll_recent_aggregates(session)
+        await session.commit()
+
+
 def start_scheduler() -> None:
     if scheduler.running:
         return
+    # Окна последних 7 дней сдвигаются до ночных отчётов.
+    scheduler.add_job(roll_aggregates_job, "cron", hour=0, minute=5)
     scheduler.add_job(generate_reports_job, "cron", hour=3, minute=0)
     scheduler.start()
 
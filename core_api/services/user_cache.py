@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import User
+
+
+logger = logging.getLogger("core_api")
+
+USER_CACHE_SIZE = int(os.getenv("CORE_USER_CACHE_SIZE") or 10000)
+USER_CACHE_TTL_S = float(os.getenv("CORE_USER_CACHE_TTL_S") or 300)
+# Межрепличная инвалидация через LISTEN/NOTIFY Postgres.
+USER_CACHE_NOTIFY = os.getenv("CORE_USER_CACHE_NOTIFY") == "1"
+NOTIFY_CHANNEL = "user_profile_changed"
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Immutable snapshot of the profile fields the routers read from ``User``."""
+
+    id: int
+    telegram_id: str
+    age: int
+    sex: str
+    height_cm: float
+    start_weight_kg: float
+    target_weight_kg: float
+    waist_cm: Optional[float]
+    hips_cm: Optional[float]
+    chest_cm: Optional[float]
+    activity_level: str
+
+    @classmethod
+    def from_model(cls, user: User) -> "CachedUser":
+        return cls(**{field.name: getattr(user, field.name) for field in fields(cls)})
+
+
+class UserCache:
+    """Bounded LRU of telegram_id -> ``CachedUser`` with a TTL.
+
+    Every invalidation bumps ``generation``; a lookup that started before an
+    invalidation does not store its (possibly stale) result.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, CachedUser]]" = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, telegram_id: str) -> Optional[CachedUser]:
+        entry = self._entries.get(telegram_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[telegram_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user: CachedUser, generation: Optional[int] = None) -> None:
+        if self.max_entries <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._entries[user.telegram_id] = (time.monotonic() + self.ttl_s, user)
+        self._entries.move_to_end(user.telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: Optional[str] = None) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        if telegram_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(telegram_id, None)
+
+    def stats(self) -> Dict[str, object]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+            "invalidations": self.invalidations,
+            "notify": USER_CACHE_NOTIFY,
+        }
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_S)
+
+
+async def get_user(session: AsyncSession, telegram_id: str) -> CachedUser:
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user
+    generation = user_cache.generation
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    row = result.scalars().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+    user = CachedUser.from_model(row)
+    user_cache.put(user, generation)
+    return user
+
+
+async def profile_changed(session: AsyncSession, telegram_id: str) -> None:
+    """Call inside the transaction that changes the profile; other replicas hear about it on commit."""
+    if USER_CACHE_NOTIFY:
+        await session.execute(text("SELECT pg_notify(:channel, :telegram_id)"), {"channel": NOTIFY_CHANNEL, "telegram_id": telegram_id})
+
+
+async def listen_for_invalidations(dsn: str) -> None:
+    """Keeps a dedicated LISTEN connection; reconnects and drops the whole cache after a break."""
+    import asyncpg
+
+    def on_notify(connection, pid, channel, payload) -> None:
+        user_cache.invalidate(payload)
+
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            await connection.add_listener(NOTIFY_CHANNEL, on_notify)
+            # Уведомления, пришедшие до подписки, потеряны: начинаем с пустого кэша.
+            user_cache.invalidate()
+            logger.info("Подписка на инвалидацию кэша пользователей активна")
+            while not connection.is_closed():
+                await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Канал инвалидации кэша пользователей недоступен: {e}")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        user_cache.invalidate()
+        await asyncio.sleep(5)
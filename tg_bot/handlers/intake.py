@@ -5,11 +5,11 @@ from typing import Any, Dict, Optional
 
 import httpx
 
-from aiogram import F, Router
+from aiogram import Bot, F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message
+from aiogram.types import Message, PhotoSize
 
 from ..services.core_api_client import CoreApiClient
 from ..services.vision_api_client import VisionApiClient
@@ -79,49 +79,15 @@ async def handle_meal_photo(message: Message) -> None:
     status_message = await message.answer("Приняла фото, анализирую…")
     bot = message.bot
     photo = message.photo[-1]
-    image_buffer = BytesIO()
-    try:
-        file = await bot.get_file(photo.file_id)
-        await bot.download_file(file.file_path, destination=image_buffer)
-    except Exception:
-        logger.exception(
-            "Failed to download photo update_id=%s file_id=%s",
-            update_id,
-            photo.file_id,
-        )
-        await status_message.edit_text(
-            "Не получилось распознать блюдо, введите калории вручную."
-        )
-        return
-    image_buffer.seek(0)
-    image_bytes = image_buffer.getvalue()
-    logger.debug(
-        "Downloaded photo for user_id=%s update_id=%s file_id=%s size=%sB",
-        telegram_id,
-        update_id,
-        photo.file_id,
-        len(image_bytes),
-    )
 
     dispatcher = bot.dispatcher
     vision_client: VisionApiClient = dispatcher["vision_api_client"]
     core_api_client: CoreApiClient = dispatcher["core_api_client"]
 
-    try:
-        logger.debug(
-            "Requesting vision estimate for update_id=%s file_id=%s",
-            update_id,
-            photo.file_id,
-        )
-        result = await vision_client.estimate_meal(
-            image_bytes, filename=f"{photo.file_unique_id}.jpg"
-        )
-    except httpx.HTTPError:
-        logger.exception(
-            "Vision service request failed update_id=%s file_id=%s",
-            update_id,
-            photo.file_id,
-        )
+    result = await _get_cached_estimate(vision_client, photo.file_unique_id)
+    if result is None:
+        result = await _download_and_estimate(bot, vision_client, photo, update_id, telegram_id)
+    if result is None:
         await status_message.edit_text(
             "Не получилось распознать блюдо, введите калории вручную."
         )
@@ -193,3 +159,67 @@ def _format_label_from_candidates(result: Dict[str, Any]) -> Optional[str]:
         if isinstance(first, str):
             return first
     return None
+
+
+async def _get_cached_estimate(
+    vision_client: VisionApiClient, file_unique_id: str
+) -> Optional[Dict[str, Any]]:
+    # Повторно присланное или пересланное фото не скачиваем заново. Для нового фото
+    # это лишний запрос к локальному сервису перед загрузкой из Telegram; он
+    # дешевле, чем скачивать и отправлять повтор.
+    try:
+        result = await vision_client.get_cached_estimate(file_unique_id)
+    except httpx.HTTPError:
+        logger.debug("Vision cache lookup failed file_unique_id=%s", file_unique_id)
+        return None
+    if result is not None:
+        logger.debug("Vision cache hit file_unique_id=%s", file_unique_id)
+    return result
+
+
+async def _download_and_estimate(
+    bot: Bot,
+    vision_client: VisionApiClient,
+    photo: PhotoSize,
+    update_id: Optional[int],
+    telegram_id: str,
+) -> Optional[Dict[str, Any]]:
+    image_buffer = BytesIO()
+    try:
+        file = await bot.get_file(photo.file_id)
+        await bot.download_file(file.file_path, destination=image_buffer)
+    except Exception:
+        logger.exception(
+            "Failed to download photo update_id=%s file_id=%s",
+            update_id,
+            photo.file_id,
+        )
+        return None
+    image_buffer.seek(0)
+    image_bytes = image_buffer.getvalue()
+    logger.debug(
+        "Downloaded photo for user_id=%s update_id=%s file_id=%s size=%sB",
+        telegram_id,
+        update_id,
+        photo.file_id,
+        len(image_bytes),
+    )
+
+    try:
+        logger.debug(
+            "Requesting vision estimate for update_id=%s file_id=%s",
+            update_id,
+            photo.file_id,
+        )
+        return await vision_client.estimate_meal(
+            image_bytes,
+            filename=f"{photo.file_unique_id}.jpg",
+            file_unique_id=photo.file_unique_id,
+        )
+    except httpx.HTTPError:
+        logger.exception(
+            "Vision service request failed update_id=%s file_id=%s",
+            update_id,
+            photo.file_id,
+        )
+        return None
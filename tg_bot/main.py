@@ -29,6 +29,7 @@ def load_settings() -> Dict[str, Any]:
         raise RuntimeError(
             "Не заданы переменные окружения: " + ", ".join(sorted(missing))
         )
+    settings["vision_raw_upload"] = os.getenv("VISION_RAW_UPLOAD") == "1"
     return settings
 
 
@@ -39,7 +40,9 @@ async def main() -> None:
     dp = Dispatcher()
 
     core_api_client = CoreApiClient(settings["core_api_base_url"])
-    vision_api_client = VisionApiClient(settings["vision_service_base_url"])
+    vision_api_client = VisionApiClient(
+        settings["vision_service_base_url"], raw_upload=settings["vision_raw_upload"]
+    )
 
     dp["core_api_client"] = core_api_client
     dp["vision_api_client"] = vision_api_client
@@ -1,18 +1,57 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import httpx
 
 
+REQUEST_TIMEOUT_S = 15.0
+# Запас на передачу ответа и сетевые задержки: сервис должен сдаться раньше клиента,
+# чтобы его 504 успел дойти до бота, а не разминуться с собственным таймаутом httpx.
+NETWORK_MARGIN_S = 1.5
+
+
 class VisionApiClient:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, raw_upload: bool = False):
         self.base_url = base_url.rstrip("/")
-        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=15.0)
+        self.raw_upload = raw_upload
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=REQUEST_TIMEOUT_S,
+            # Сервис бросает работу, которую клиент уже не дождётся.
+            headers={"X-Request-Timeout-Ms": str(int((REQUEST_TIMEOUT_S - NETWORK_MARGIN_S) * 1000))},
+        )
 
     async def aclose(self) -> None:
         await self._client.aclose()
 
-    async def estimate_meal(self, image_bytes: bytes, filename: str) -> Dict[str, Any]:
+    async def estimate_meal(
+        self,
+        image_bytes: bytes,
+        filename: str,
+        file_unique_id: Optional[str] = None,
+        raw: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        if raw if raw is not None else self.raw_upload:
+            # Тело запроса — само изображение, без multipart-обёртки.
+            params = {"file_unique_id": file_unique_id} if file_unique_id else None
+            response = await self._client.post(
+                "/vision/estimate_meal/raw",
+                content=image_bytes,
+                params=params,
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            response.raise_for_status()
+            return response.json()
         files = {"image": (filename, image_bytes, "image/jpeg")}
-        response = await self._client.post("/vision/estimate_meal", files=files)
+        data = {"file_unique_id": file_unique_id} if file_unique_id else None
+        response = await self._client.post("/vision/estimate_meal", files=files, data=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_cached_estimate(self, file_unique_id: str) -> Optional[Dict[str, Any]]:
+        response = await self._client.get(
+            "/vision/estimate_meal/cached", params={"file_unique_id": file_unique_id}
+        )
+        if response.status_code == 404:
+            return None
         response.raise_for_status()
         return response.json()
@@ -1,16 +1,100 @@
-from pathlib import Path
+from contextlib import asynccontextmanager
+from functools import partial
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from . import config
+from .batching import MicroBatcher
+from .cache import EstimateCache
+from .executor import InferencePool
+from .phash import PerceptualIndex
+from .inference import classify_batch_timed
+from .metrics import BATCH_SIZE, QUEUE_WAIT_SECONDS, REGISTRY, Gauge, UploadTimer, record_stages
 from .routers.estimate_meal import get_router
+from .nutrition import shared_store
 from .service import NutritionService
 
 
-nutrition_service = NutritionService(Path(__file__).parent / "nutrition_db.json")
-app = FastAPI(title="Vision Service", description="Оценка блюд по фото")
-app.include_router(get_router(nutrition_service))
+nutrition_service = NutritionService(shared_store())
+estimate_cache = EstimateCache(config.CACHE_MAX_ENTRIES, config.CACHE_TTL_S)
+phash_index = PerceptualIndex(config.PHASH_INDEX_SIZE, config.PHASH_MAX_DISTANCE)
+inference_pool = InferencePool(config.EXECUTOR_MODE, config.EXECUTOR_WORKERS)
+
+
+def _record_batch(batch_size: int, queue_waits, stages) -> None:
+    BATCH_SIZE.observe(batch_size)
+    QUEUE_WAIT_SECONDS.observe_many(queue_waits)
+    record_stages(stages)
+
+
+batcher = MicroBatcher(
+    partial(classify_batch_timed, topk=config.TOPK),
+    max_batch_size=config.BATCH_MAX_SIZE,
+    max_wait_ms=config.BATCH_MAX_WAIT_MS,
+    max_concurrent_batches=config.EXECUTOR_WORKERS,
+    max_queue=config.QUEUE_MAX,
+    on_batch=_record_batch,
+)
+
+# --- Метрики, которые читаются в момент запроса /metrics ---
+REGISTRY.register(Gauge("vision_queue_depth", "Images and plates waiting for the micro-batcher.", lambda: batcher.queue_depth))
+REGISTRY.register(Gauge(
+    "vision_batcher_dropped_total",
+    "Queued images dropped before the forward because their caller had gone.",
+    lambda: batcher.dropped,
+    kind="counter",
+))
+REGISTRY.register(Gauge("vision_batches_in_flight", "Batches currently running in the inference pool.", lambda: batcher.batches_in_flight))
+MODEL_INFO_LABELS = ("backend", "quantization", "classifier", "portion", "cascade")
+
+
+def _model_info_sample():
+    if not inference_pool.model_info:
+        return {}
+    return {tuple(str(inference_pool.model_info.get(k)) for k in MODEL_INFO_LABELS): 1}
+
+
+REGISTRY.register(Gauge("vision_model_info", "Loaded model configuration.", _model_info_sample, labels=MODEL_INFO_LABELS))
+REGISTRY.register(Gauge(
+    "vision_cache_requests_total",
+    "Estimate cache lookups by outcome.",
+    lambda: {("hit",): estimate_cache.hits, ("miss",): estimate_cache.misses},
+    labels=("result",),
+    kind="counter",
+))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Модель загружается и прогревается до того, как сервис начнёт принимать запросы.
+    await inference_pool.start()
+    await batcher.start(executor=inference_pool.executor)
+    try:
+        yield
+    finally:
+        inference_pool.ready = False
+        await batcher.stop()
+        inference_pool.shutdown()
+
+
+app = FastAPI(title="Vision Service", description="Оценка блюд по фото", lifespan=lifespan)
+app.include_router(get_router(nutrition_service, batcher, estimate_cache, phash_index))
+# Пакетная загрузка в upload_read не входит: стадия считается на одно изображение.
+app.add_middleware(UploadTimer, paths=("/vision/estimate_meal", "/vision/estimate_meal/raw", "/vision/estimate_plate"))
 
 
 @app.get("/health")
 async def healthcheck():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+async def readiness():
+    body = {"status": "ready" if inference_pool.ready else "not_ready", "model": inference_pool.model_info}
+    return JSONResponse(body, status_code=200 if inference_pool.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,187 @@
+"""Interchangeable inference backends: eager PyTorch, frozen TorchScript, ONNX Runtime."""
+
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+import torch
+
+from .preprocessing import CROP_SIZE
+
+
+logger = logging.getLogger("vision_service")
+
+BACKENDS = ("eager", "torchscript", "onnx")
+
+# Меняется при изменении выходов модели, чтобы не подхватить старые артефакты.
+ARTIFACT_TAG = "emb"
+
+BackendOutput = Tuple[torch.Tensor, torch.Tensor]
+
+# Размер эмбеддинга EfficientNet-B0 после global average pooling.
+EMBEDDING_DIM = 1280
+
+
+class EmbeddingClassifier(torch.nn.Module):
+    """EfficientNet (or MobileNetV3, same layout) whose forward returns both the pooled embedding and the logits."""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.features = model.features
+        self.avgpool = model.avgpool
+        self.classifier = model.classifier
+
+    def forward(self, x: torch.Tensor) -> BackendOutput:
+        embeddings = torch.flatten(self.avgpool(self.features(x)), 1)
+        return embeddings, self.classifier(embeddings)
+
+
+def _example_input(channels_last: bool = False) -> torch.Tensor:
+    x = torch.zeros((1, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    return x.contiguous(memory_format=torch.channels_last) if channels_last else x
+
+
+class InferenceBackend:
+    """Maps a normalized (N, C, H, W) float32 batch to (N, EMBEDDING_DIM) embeddings and (N, 1000) ImageNet logits."""
+
+    name = "base"
+
+    def __init__(self, quantization: str = "none"):
+        self.quantization = quantization
+        self.shared_weights = False
+
+    def __call__(self, batch: torch.Tensor) -> BackendOutput:
+        raise NotImplementedError
+
+    def info(self) -> Dict[str, object]:
+        return {"backend": self.name, "quantization": self.quantization, "shared_weights": self.shared_weights}
+
+
+class EagerBackend(InferenceBackend):
+    name = "eager"
+
+    def __init__(self, model: torch.nn.Module, channels_last: bool = False, quantization: str = "none"):
+        super().__init__(quantization)
+        self.channels_last = channels_last and quantization == "none"
+        self.model = model.to(memory_format=torch.channels_last) if self.channels_last else model
+
+    def __call__(self, batch: torch.Tensor) -> BackendOutput:
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            return self.model(batch)
+
+
+class TorchScriptBackend(InferenceBackend):
+    name = "torchscript"
+
+    def __init__(self, module: torch.jit.ScriptModule, channels_last: bool = False, quantization: str = "none"):
+        super().__init__(quantization)
+        self.module = module
+        self.channels_last = channels_last
+
+    def __call__(self, batch: torch.Tensor) -> BackendOutput:
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        with torch.inference_mode():
+            return self.module(batch)
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, path: str, threads: int):
+        super().__init__()
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: torch.Tensor) -> BackendOutput:
+        embeddings, logits = self.session.run(None, {self.input_name: batch.contiguous().numpy()})
+        return torch.from_numpy(embeddings), torch.from_numpy(logits)
+
+
+# --- TorchScript-артефакт ---
+def torchscript_artifact_path(cache_dir: str, digest: str, channels_last: bool, arch: str = "efficientnet_b0") -> str:
+    suffix = ".cl" if channels_last else ""
+    return os.path.join(cache_dir, f"{arch}_{digest[:16]}.{ARTIFACT_TAG}{suffix}.torchscript.pt")
+
+
+def load_torchscript(path: str) -> Optional[torch.jit.ScriptModule]:
+    if not os.path.exists(path):
+        return None
+    try:
+        return torch.jit.load(path, map_location="cpu")
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить артефакт модели, собираем заново: {e}")
+        return None
+
+
+def export_torchscript(model: torch.nn.Module, path: str, channels_last: bool) -> torch.jit.ScriptModule:
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    with torch.no_grad():
+        traced = torch.jit.trace(model, _example_input(channels_last))
+    # freeze встраивает веса как константы и сворачивает BatchNorm в свёртки.
+    frozen = torch.jit.freeze(traced)
+    tmp = path + ".tmp"
+    torch.jit.save(frozen, tmp)
+    os.replace(tmp, path)
+    logger.info(f"Сохранён артефакт модели: {path}")
+    return frozen
+
+
+# --- ONNX-артефакт ---
+def onnx_artifact_path(cache_dir: str, digest: str) -> str:
+    return os.path.join(cache_dir, f"efficientnet_b0_{digest[:16]}.{ARTIFACT_TAG}.onnx")
+
+
+def export_onnx(model: torch.nn.Module, path: str) -> None:
+    tmp = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            _example_input(),
+            tmp,
+            input_names=["images"],
+            output_names=["embeddings", "logits"],
+            dynamic_axes={"images": {0: "batch"}, "embeddings": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17,
+        )
+    os.replace(tmp, path)
+    logger.info(f"Сохранена ONNX-модель: {path}")
+
+
+# --- Веса, общие для нескольких процессов ---
+def shared_weights_path(cache_dir: str, digest: str, channels_last: bool) -> str:
+    suffix = ".cl" if channels_last else ""
+    return os.path.join(cache_dir, f"efficientnet_b0_{digest[:16]}.{ARTIFACT_TAG}{suffix}.shared.pt")
+
+
+def export_shared_weights(model: torch.nn.Module, path: str, channels_last: bool) -> None:
+    """Saves the state dict in the layout the backend runs with.
+
+    Tensors that are already channels-last need no conversion after
+    ``torch.load(mmap=True)``, so no process ends up with a private copy.
+    """
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    tmp = path + ".tmp"
+    torch.save(model.state_dict(), tmp)
+    os.replace(tmp, path)
+    logger.info(f"Сохранены общие веса модели: {path}")
+
+
+def load_shared_weights(path: str) -> Optional[Dict[str, torch.Tensor]]:
+    """State dict backed by the memory-mapped file; its pages stay shared between processes until written."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except Exception as e:
+        logger.warning(f"Не удалось отобразить общие веса, собираем заново: {e}")
+        return None
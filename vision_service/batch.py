@@ -0,0 +1,258 @@
+"""Many-image estimation: multipart parts or one archive in, NDJSON lines out."""
+
+import asyncio
+import json
+import logging
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from typing import IO, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+
+logger = logging.getLogger("vision_service")
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# (имя, байты) или (имя, текст ошибки), если элемент пропущен до инференса.
+BatchItem = Tuple[str, Optional[bytes], Optional[str]]
+EstimateFn = Callable[[bytes], Awaitable[dict]]
+
+_END = object()
+
+
+def _is_image_name(name: str) -> bool:
+    return name.lower().endswith(IMAGE_SUFFIXES)
+
+
+def iter_archive(fileobj: IO[bytes], max_item_bytes: int) -> Iterator[BatchItem]:
+    """Lazily yields image members of a zip or tar(.gz) archive, one at a time."""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        yield from _iter_zip(fileobj, max_item_bytes)
+        return
+
+    fileobj.seek(0)
+    try:
+        # Потоковый режим "r|*": tar не индексируется целиком, члены читаются по порядку.
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile() or not _is_image_name(member.name):
+                    continue
+                if member.size > max_item_bytes:
+                    yield member.name, None, "Файл слишком большой"
+                    continue
+                extracted = archive.extractfile(member)
+                yield member.name, extracted.read() if extracted else b"", None
+    except tarfile.TarError as e:
+        raise ValueError(f"Архив не распознан: {e}") from e
+
+
+def _iter_zip(fileobj: IO[bytes], max_item_bytes: int) -> Iterator[BatchItem]:
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not _is_image_name(info.filename):
+                continue
+            if info.file_size > max_item_bytes:
+                yield info.filename, None, "Файл слишком большой"
+                continue
+            try:
+                with archive.open(info) as member:
+                    # Размер из заголовка можно подделать, поэтому читаем не больше лимита.
+                    data = member.read(max_item_bytes + 1)
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError) as e:
+                yield info.filename, None, f"Не удалось распаковать: {e}"
+                continue
+            if len(data) > max_item_bytes:
+                yield info.filename, None, "Файл слишком большой"
+                continue
+            yield info.filename, data, None
+
+
+class _Part:
+    """One multipart part being received: headers, then an image buffer or an archive spool."""
+
+    def __init__(self) -> None:
+        self.headers: Dict[bytes, bytes] = {}
+        self.field = b""
+        self.value = b""
+        self.name = b""
+        self.filename = ""
+        self.data: Optional[bytearray] = None
+        self.spool: Optional[IO[bytes]] = None
+        self.error: Optional[str] = None
+
+
+def multipart_boundary(content_type: str) -> bytes:
+    """Boundary of a ``multipart/form-data`` Content-Type; ValueError for anything else."""
+    media_type, params = parse_options_header(content_type)
+    if media_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise ValueError("Ожидается multipart/form-data")
+    return params[b"boundary"]
+
+
+async def iter_multipart(
+    chunks: AsyncIterator[bytes], boundary: bytes, max_item_bytes: int, max_files: int
+) -> AsyncIterator[BatchItem]:
+    """Yields ``images`` parts and the members of an ``archive`` part while the body is still arriving.
+
+    The body is pulled only when the consumer asks for the next item, so at
+    most one chunk's worth of parts is held beyond the caller's in-flight
+    items. An image part is buffered up to ``max_item_bytes``; an archive is
+    spooled to a temporary file, since zip needs seeking, and read lazily
+    once its part ends. Raises ValueError for a malformed body or more than
+    ``max_files`` image parts.
+    """
+    ready: List[Union[BatchItem, IO[bytes]]] = []
+    part = _Part()
+    files = 0
+
+    def on_part_begin() -> None:
+        nonlocal part
+        part = _Part()
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        part.field += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        part.value += data[start:end]
+
+    def on_header_end() -> None:
+        part.headers[part.field.lower()] = part.value
+        part.field = part.value = b""
+
+    def on_headers_finished() -> None:
+        nonlocal files
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        # Текстовые поля формы (без filename) пропускаем, как и раньше.
+        part.name = options.get(b"name", b"") if b"filename" in options else b""
+        part.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+        content_type = part.headers.get(b"content-type", b"").decode("latin-1")
+        if part.name == b"images":
+            files += 1
+            if files > max_files:
+                raise ValueError(f"Больше {max_files} файлов в одном запросе")
+            if content_type and not content_type.startswith("image/"):
+                part.error = "Файл должен быть изображением"
+            else:
+                part.data = bytearray()
+        elif part.name == b"archive":
+            # Диск, а не память: архив может быть любого размера.
+            part.spool = tempfile.TemporaryFile()
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        if part.spool is not None:
+            part.spool.write(data[start:end])
+        elif part.data is not None:
+            if len(part.data) + end - start > max_item_bytes:
+                part.data = None
+                part.error = "Файл слишком большой"
+            else:
+                part.data += data[start:end]
+
+    def on_part_end() -> None:
+        if part.spool is not None:
+            ready.append(part.spool)
+        elif part.name == b"images":
+            ready.append((part.filename, bytes(part.data) if part.data is not None else None, part.error))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    spools: List[IO[bytes]] = []
+    try:
+        async for chunk in chunks:
+            parser.write(chunk)
+            for entry in ready:
+                if isinstance(entry, tuple):
+                    yield entry
+                    continue
+                spools.append(entry)
+                async for item in iter_in_threadpool(iter_archive(entry, max_item_bytes)):
+                    yield item
+                entry.close()
+            ready.clear()
+        parser.finalize()
+    finally:
+        if part.spool is not None:
+            part.spool.close()
+        for spool in spools:
+            spool.close()
+
+
+async def iter_in_threadpool(items: Iterator[BatchItem]) -> AsyncIterator[BatchItem]:
+    # Чтение из временного файла и распаковка блокируют, поэтому вне event loop.
+    while True:
+        item = await run_in_threadpool(next, items, _END)
+        if item is _END:
+            return
+        yield item
+
+
+async def stream_estimates(
+    items: AsyncIterator[BatchItem],
+    estimate: EstimateFn,
+    max_inflight: int,
+) -> AsyncIterator[bytes]:
+    """Runs ``estimate`` on items with at most ``max_inflight`` pending; yields NDJSON lines in completion order.
+
+    New items are only read once a slot frees up, so memory is bounded by
+    ``max_inflight`` images however large the upload is. Concurrent estimates
+    reach the shared ``MicroBatcher`` together and are run as batched forwards.
+    """
+    pending: Set[asyncio.Task] = set()
+    index = 0
+    exhausted = False
+    try:
+        while not exhausted or pending:
+            while not exhausted and len(pending) < max_inflight:
+                try:
+                    name, data, error = await items.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                except ValueError as e:
+                    # Повреждённый архив обнаруживается уже во время чтения: дописываем начатое.
+                    logger.warning(f"Пакетная оценка: чтение прервано: {e}")
+                    yield _line({"index": index, "error": str(e)})
+                    exhausted = True
+                    break
+                if error is not None:
+                    yield _line({"index": index, "filename": name, "error": error})
+                else:
+                    pending.add(asyncio.create_task(_run(index, name, data, estimate)))
+                index += 1
+            if not pending:
+                continue
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield _line(task.result())
+    finally:
+        # Клиент отключился или ответ прерван: незавершённые оценки больше не нужны.
+        for task in pending:
+            task.cancel()
+    logger.info("Batch estimate: %s items", index)
+
+
+async def _run(index: int, name: str, data: bytes, estimate: EstimateFn) -> dict:
+    try:
+        return {"index": index, "filename": name, "result": await estimate(data)}
+    except ValueError as e:
+        return {"index": index, "filename": name, "error": str(e)}
+    except Exception as e:
+        logger.error(f"Ошибка оценки {name}: {e}")
+        return {"index": index, "filename": name, "error": "Внутренняя ошибка"}
+
+
+def _line(payload: dict) -> bytes:
+    return (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
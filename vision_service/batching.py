@@ -0,0 +1,217 @@
+"""Async micro-batching of concurrent inference requests."""
+
+import asyncio
+import logging
+import math
+from concurrent.futures import Executor
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger("vision_service")
+
+BatchFn = Callable[[Sequence[Any]], List[Any]]
+
+
+class QueueFull(Exception):
+    """Raised by ``submit`` when ``max_queue`` items are already waiting."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Очередь инференса переполнена")
+        self.retry_after = retry_after
+
+
+class _Call(NamedTuple):
+    fn: Callable[..., Any]
+    args: Tuple[Any, ...]
+
+
+class MicroBatcher:
+    """Collects concurrent submissions into batches for a synchronous batch function.
+
+    A batch is flushed when it reaches ``max_batch_size`` items or when
+    ``max_wait_ms`` has passed since its first item arrived. The batch function
+    runs in ``executor`` (the loop's default one if not given) and must return
+    one result per input, in order. Up to ``max_concurrent_batches`` batches may
+    be in flight at once, which lets a multi-worker pool stay busy.
+
+    At most ``max_queue`` items may wait (0 means unbounded); beyond that
+    ``submit`` raises ``QueueFull`` with a ``Retry-After`` estimate instead of
+    growing the backlog. A caller that stops waiting (deadline, disconnect)
+    cancels its future, and such items are dropped before the model runs.
+
+    ``run`` queues work that already is a batch (a plate's crops): it waits
+    its turn in the same queue under the same ``max_queue`` limit, and then
+    runs alone instead of being merged with other items.
+
+    With ``on_batch`` set, ``batch_fn`` returns ``(results, stats)`` instead
+    and ``on_batch(batch_size, queue_waits, stats)`` is called on the event
+    loop, ``queue_waits`` being the seconds each item spent in the queue.
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        max_concurrent_batches: int = 1,
+        max_queue: int = 0,
+        on_batch: Optional[Callable[[int, List[float], Any], None]] = None,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.executor = executor
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.max_queue = max(0, max_queue)
+        self.on_batch = on_batch
+        # Сглаженная длительность батча — для оценки Retry-After.
+        self._batch_seconds = 0.1
+        self.rejected = 0
+        self.dropped = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: set = set()
+        self._queue: Optional[asyncio.Queue] = None
+        # Вызов ``run``, вынутый из очереди при сборке батча: идёт следующим.
+        self._held: Optional[Tuple[Any, asyncio.Future, float]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, executor: Optional[Executor] = None) -> None:
+        if self._task is not None:
+            return
+        if executor is not None:
+            self.executor = executor
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        pending = [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        if self._held is not None:
+            pending.append(self._held)
+            self._held = None
+        for _, future, _ in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Батчер остановлен"))
+
+    @property
+    def queue_depth(self) -> int:
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + (self._held is not None)
+
+    @property
+    def batches_in_flight(self) -> int:
+        return len(self._inflight)
+
+    @property
+    def full(self) -> bool:
+        return bool(self.max_queue) and self.queue_depth >= self.max_queue
+
+    def retry_after(self) -> int:
+        # Сколько батчей нужно, чтобы разобрать очередь, при текущей скорости.
+        batches = self.queue_depth / (self.max_batch_size * self.max_concurrent_batches)
+        return max(1, math.ceil(batches * self._batch_seconds))
+
+    async def submit(self, item: Any) -> Any:
+        if self._task is None:
+            raise RuntimeError("Батчер не запущен")
+        if self.full:
+            self.rejected += 1
+            raise QueueFull(self.retry_after())
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put_nowait((item, future, loop.time()))
+        return await future
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Queue ``fn(*args)`` to run in the executor as a batch of its own; raises ``QueueFull`` like ``submit``."""
+        return await self.submit(_Call(fn, args))
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        if self._held is not None:
+            batch, self._held = [self._held], None
+        else:
+            batch = [await self._queue.get()]
+        if isinstance(batch[0][0], _Call):
+            return batch
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Всё, что уже лежит в очереди, забираем без ожидания.
+            if not self._queue.empty():
+                entry = self._queue.get_nowait()
+            else:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if isinstance(entry[0], _Call):
+                self._held = entry
+                break
+            batch.append(entry)
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Пока все слоты заняты, запросы копятся в очереди и следующий батч
+            # получается больше.
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]) -> None:
+        try:
+            # Клиент мог уйти или истёк его дедлайн, пока запрос ждал в очереди:
+            # такие элементы отбрасываем до запуска модели.
+            alive = [(item, future, enqueued) for item, future, enqueued in batch if not future.done()]
+            self.dropped += len(batch) - len(alive)
+            if not alive:
+                return
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            queue_waits = [started - enqueued for _, _, enqueued in alive]
+            items = [item for item, _, _ in alive]
+            call = items[0] if isinstance(items[0], _Call) else None
+            try:
+                if call is not None:
+                    results = [await loop.run_in_executor(self.executor, call.fn, *call.args)]
+                else:
+                    results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+            except Exception as e:
+                if call is None:
+                    logger.error(f"Ошибка пакетного инференса: {e}")
+                for _, future, _ in alive:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self._batch_seconds = 0.8 * self._batch_seconds + 0.2 * (loop.time() - started)
+            if self.on_batch is not None and call is None:
+                results, stats = results
+                try:
+                    self.on_batch(len(items), queue_waits, stats)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика статистики батча: {e}")
+            for (_, future, _), result in zip(alive, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._slots.release()
@@ -0,0 +1,158 @@
+"""Bounded LRU+TTL cache of meal estimates with in-flight deduplication."""
+
+import asyncio
+import hashlib
+import sys
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def content_key(image_bytes: bytes) -> str:
+    return "sha256:" + hashlib.sha256(image_bytes).hexdigest()
+
+
+def file_key(file_unique_id: str) -> str:
+    return "tg:" + file_unique_id
+
+
+def plate_key(image_bytes: bytes) -> str:
+    # Анализ тарелки — другой ответ на то же изображение.
+    return "plate:" + content_key(image_bytes)
+
+
+def worth_caching(value: Dict[str, Any]) -> bool:
+    # Пустой ответ (сбой декодирования или модели) не закрепляем за фото на весь TTL.
+    return bool(value.get("label") or value.get("items"))
+
+
+def _approx_size(value: Any) -> int:
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_approx_size(v) for v in value)
+    return size
+
+
+class EstimateCache:
+    """LRU cache with per-entry TTL; several keys may point to one entry.
+
+    ``get_or_compute`` makes concurrent callers with the same key share one
+    computation instead of classifying the same image several times. The
+    computation survives any single caller leaving, but is cancelled once
+    every caller has given up on it (deadline or disconnect), so abandoned
+    work does not reach the model. Empty results (no label, no plate items)
+    are returned but not stored.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: float = 3600.0):
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl_seconds
+        # ключ -> (момент истечения, результат, примерный размер в байтах)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any], int]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[Dict[str, Any]]:
+        value = self._lookup(key)
+        if value is None:
+            if count_miss:
+                self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, keys: Iterable[str], value: Dict[str, Any]) -> None:
+        if not self.max_entries:
+            return
+        expires_at = time.monotonic() + self.ttl
+        size = _approx_size(value)
+        for key in keys:
+            if key in self._entries:
+                self._evict(key)
+            self._entries[key] = (expires_at, value, size)
+            self._bytes += size
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    async def get_or_compute(
+        self, keys: Iterable[str], compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        keys = list(keys)
+        for key in keys:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                # Дополняем остальные ключи, чтобы следующий поиск был дешёвым.
+                self.put([k for k in keys if k not in self._entries], value)
+                return value
+        self.misses += 1
+        for key in keys:
+            pending = self._inflight.get(key)
+            if pending is not None:
+                self.shared += 1
+                return await self._wait(pending)
+
+        # Вычисление живёт отдельной задачей: если первый клиент уйдёт,
+        # остальные ожидающие всё равно получат результат.
+        task = asyncio.ensure_future(compute())
+        for key in keys:
+            self._inflight[key] = task
+        task.add_done_callback(partial(self._finish, keys))
+        return await self._wait(task)
+
+    async def _wait(self, task: asyncio.Future) -> Dict[str, Any]:
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            left = self._waiters.get(task, 1) - 1
+            if left > 0:
+                self._waiters[task] = left
+            else:
+                self._waiters.pop(task, None)
+                if not task.done():
+                    # Результат больше никому не нужен.
+                    task.cancel()
+
+    def _finish(self, keys: List[str], task: asyncio.Future) -> None:
+        self._waiters.pop(task, None)
+        for key in keys:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+        if not task.cancelled() and task.exception() is None and worth_caching(task.result()):
+            self.put(keys, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "keys": len(self._entries),
+            "max_keys": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_inflight": self.shared,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "approx_bytes": self._bytes,
+        }
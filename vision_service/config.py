@@ -0,0 +1,90 @@
+"""Environment-driven settings for the vision service."""
+
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return int(value)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return float(value)
+
+
+# --- Микробатчинг инференса ---
+BATCH_MAX_SIZE = max(1, _env_int("VISION_BATCH_MAX_SIZE", 8))
+BATCH_MAX_WAIT_MS = max(0.0, _env_float("VISION_BATCH_MAX_WAIT_MS", 5.0))
+TOPK = max(1, _env_int("VISION_TOPK", 3))
+# Доля вероятности ImageNet, перенесённая на блюдо, ниже которой блюдо не предлагается.
+MIN_DISH_CONFIDENCE = max(0.0, _env_float("VISION_MIN_DISH_CONFIDENCE", 0.05))
+
+# --- Допуск запросов и дедлайны ---
+QUEUE_MAX = max(0, _env_int("VISION_QUEUE_MAX", 256))
+REQUEST_TIMEOUT_MS = max(1, _env_int("VISION_REQUEST_TIMEOUT_MS", 15_000))
+
+# --- Пул исполнения инференса ---
+EXECUTOR_MODE = os.getenv("VISION_EXECUTOR") or "thread"
+EXECUTOR_WORKERS = max(1, _env_int("VISION_WORKERS", 1))
+
+# --- Несколько процессов сервера (python -m vision_service.serve) ---
+SERVER_WORKERS = max(1, _env_int("VISION_SERVER_WORKERS", 1))
+# Потоков torch на процесс; 0 — доступные ядра поровну между процессами сервера.
+TORCH_THREADS = max(0, _env_int("VISION_TORCH_THREADS", 0))
+PIN_CPUS = _env_int("VISION_PIN_CPUS", 0) != 0
+# Веса отображаются в память из файла и делятся между процессами через page cache.
+SHARED_WEIGHTS = _env_int("VISION_SHARED_WEIGHTS", 1 if SERVER_WORKERS > 1 else 0) != 0
+
+# --- Кэш оценок ---
+CACHE_MAX_ENTRIES = max(0, _env_int("VISION_CACHE_MAX_ENTRIES", 4096))
+CACHE_TTL_S = _env_float("VISION_CACHE_TTL_S", 3600.0)
+
+# --- Поиск почти-дубликатов по перцептивному хешу ---
+PHASH_INDEX_SIZE = max(0, _env_int("VISION_PHASH_INDEX_SIZE", 4096))
+PHASH_MAX_DISTANCE = _env_int("VISION_PHASH_MAX_DISTANCE", 4)
+
+# --- Ограничения на входные изображения ---
+MAX_IMAGE_PIXELS = max(1, _env_int("VISION_MAX_IMAGE_PIXELS", 40_000_000))
+MAX_IMAGE_SIDE = max(1, _env_int("VISION_MAX_IMAGE_SIDE", 12_000))
+MAX_IMAGE_BYTES = max(1, _env_int("VISION_MAX_IMAGE_BYTES", 20 * 1024 * 1024))
+
+# --- Пакетная оценка (/vision/estimate_meal/batch) ---
+BATCH_MAX_INFLIGHT = max(1, _env_int("VISION_BATCH_MAX_INFLIGHT", 32))
+BATCH_MAX_FILES = max(1, _env_int("VISION_BATCH_MAX_FILES", 1000))
+
+# --- Холодный старт модели ---
+WARMUP_ITERATIONS = max(0, _env_int("VISION_WARMUP_ITERATIONS", 2))
+
+# --- INT8-квантизация ---
+QUANTIZATION = os.getenv("VISION_QUANTIZATION") or "none"
+
+# --- Бэкенд инференса ---
+BACKEND = os.getenv("VISION_BACKEND") or "torchscript"
+CHANNELS_LAST = _env_int("VISION_CHANNELS_LAST", 1) != 0
+
+# --- kNN-классификатор по эмбеддингам ---
+KNN_INDEX = os.getenv("VISION_KNN_INDEX") or ""
+KNN_K = max(1, _env_int("VISION_KNN_K", 10))
+KNN_MMAP = _env_int("VISION_KNN_MMAP", 1) != 0
+KNN_CHUNK_ROWS = max(1, _env_int("VISION_KNN_CHUNK_ROWS", 16384))
+
+# --- Оценка порции по эмбеддингу ---
+PORTION_HEAD = os.getenv("VISION_PORTION_HEAD") or ""
+
+# --- Каскад моделей ---
+# Порог уверенности быстрой модели, начиная с которого EfficientNet не запускается; 0 — каскад выключен.
+CASCADE_THRESHOLD = _env_float("VISION_CASCADE_THRESHOLD", 0.0)
+# Доля вероятности на «пищевых» классах ImageNet, ниже которой фото считается не едой.
+CASCADE_NONFOOD_MASS = _env_float("VISION_CASCADE_NONFOOD_MASS", 0.05)
+# Разброс нормализованных пикселей, ниже которого кадр пустой (0 — фильтр выключен).
+PREFILTER_BLANK_STD = _env_float("VISION_PREFILTER_BLANK_STD", 0.05)
+
+# --- Анализ тарелки (несколько блюд на фото) ---
+PLATE_GRID = max(1, _env_int("VISION_PLATE_GRID", 3))
+PLATE_MIN_CONFIDENCE = _env_float("VISION_PLATE_MIN_CONFIDENCE", 0.1)
+PLATE_NMS_IOU = _env_float("VISION_PLATE_NMS_IOU", 0.5)
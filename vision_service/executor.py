@@ -0,0 +1,89 @@
+"""Thread/process pools that run model inference off the event loop."""
+
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from . import config
+from .inference import model_info, warmup
+
+
+logger = logging.getLogger("vision_service")
+
+EXECUTOR_MODES = ("thread", "process")
+
+_init_lock = threading.Lock()
+
+
+def _init_worker() -> None:
+    # Потоки делят одну модель из lru_cache, поэтому первую загрузку сериализуем.
+    with _init_lock:
+        warmup(config.WARMUP_ITERATIONS)
+
+
+def _ping() -> Dict[str, object]:
+    return model_info()
+
+
+class InferencePool:
+    """Pool of preloaded inference workers.
+
+    Each worker loads ``_load_model()`` and runs a warmup forward in its
+    initializer, so the first request routed to it does not pay for model
+    loading. ``ready`` turns true once every worker reports loaded weights.
+    """
+
+    def __init__(self, mode: str = "thread", workers: int = 1):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Неизвестный режим исполнения: {mode}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._executor: Optional[Executor] = None
+        self.ready = False
+        self.model_info: Dict[str, object] = {}
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            raise RuntimeError("Пул инференса не запущен")
+        return self._executor
+
+    async def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.mode == "process":
+            # fork после инициализации torch небезопасен, поэтому spawn.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="vision-infer",
+                initializer=_init_worker,
+            )
+        # Пулы поднимают воркеров лениво: отправляем по задаче на каждого,
+        # чтобы все они загрузили модель до первого пользовательского запроса.
+        loop = asyncio.get_running_loop()
+        infos = await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+        self.model_info = infos[0]
+        self.ready = all(info["weights_loaded"] for info in infos)
+        logger.info(
+            "Пул инференса запущен: mode=%s workers=%s model=%s ready=%s",
+            self.mode,
+            self.workers,
+            self.model_info.get("format"),
+            self.ready,
+        )
+
+    def shutdown(self) -> None:
+        self.ready = False
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
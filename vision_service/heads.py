@@ -0,0 +1,70 @@
+"""Lightweight heads on the shared EfficientNet embedding (portion size regression)."""
+
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+
+
+logger = logging.getLogger("vision_service")
+
+MIN_PORTION_GRAMS = 20.0
+MAX_PORTION_GRAMS = 1500.0
+
+
+class PortionHead:
+    """Linear regression of log-grams on the pooled embedding.
+
+    Runs on the embeddings the backend already returns for dish
+    classification, so a portion estimate costs one (N, D) x (D,) product
+    instead of a second model and a second forward pass.
+    """
+
+    def __init__(self, weight: np.ndarray, bias: float):
+        self.weight = np.ascontiguousarray(weight, dtype=np.float32)
+        self.bias = float(bias)
+
+    @property
+    def dim(self) -> int:
+        return len(self.weight)
+
+    def predict(self, embeddings: np.ndarray) -> np.ndarray:
+        """(N, D) embeddings -> (N,) portion estimates in grams."""
+        log_grams = embeddings @ self.weight + self.bias
+        return np.clip(np.exp(log_grams), MIN_PORTION_GRAMS, MAX_PORTION_GRAMS)
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, grams: np.ndarray, l2: float = 1.0) -> "PortionHead":
+        """Closed-form ridge regression; the intercept is not regularized."""
+        x = np.asarray(embeddings, dtype=np.float64)
+        y = np.log(np.clip(np.asarray(grams, dtype=np.float64), MIN_PORTION_GRAMS, MAX_PORTION_GRAMS))
+        x_mean = x.mean(axis=0)
+        y_mean = y.mean()
+        xc = x - x_mean
+        weight = np.linalg.solve(xc.T @ xc + l2 * np.eye(x.shape[1]), xc.T @ (y - y_mean))
+        return cls(weight, y_mean - x_mean @ weight)
+
+    @classmethod
+    def load(cls, path: str) -> "PortionHead":
+        with np.load(path) as data:
+            return cls(data["weight"], float(data["bias"]))
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, weight=self.weight, bias=np.float32(self.bias))
+        os.replace(tmp, path)
+
+
+def load_portion_head(path: str, dim: int) -> Optional[PortionHead]:
+    if not path:
+        return None
+    try:
+        head = PortionHead.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        logger.error(f"Не удалось загрузить голову оценки порции, используем стандартные порции: {e}")
+        return None
+    if head.dim != dim:
+        logger.error(f"Голова оценки порции ожидает эмбеддинги размера {head.dim}, а модель даёт {dim}")
+        return None
+    return head
@@ -4,29 +4,59 @@ import os
 import json
 import hashlib
 import logging
+import time
 from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional, Sequence, Tuple
 
 import torch
-from torchvision import transforms, models
-from PIL import Image, UnidentifiedImageError
-from io import BytesIO
+from torchvision import models
 
 from torchvision.models import EfficientNet_B0_Weights
 
+from . import config
+from .heads import PortionHead, load_portion_head
+from .knn import EmbeddingIndex
+from .nutrition import shared_store
+from .projection import ProjectionSource
+from .plate import tile_views
+from .preprocessing import CROP_SIZE, ImageRejected, decode, decode_tiled, to_tensor
+from .backends import (
+    BACKENDS,
+    EMBEDDING_DIM,
+    EagerBackend,
+    EmbeddingClassifier,
+    InferenceBackend,
+    OnnxBackend,
+    TorchScriptBackend,
+    export_onnx,
+    export_shared_weights,
+    export_torchscript,
+    load_shared_weights,
+    load_torchscript,
+    onnx_artifact_path,
+    shared_weights_path,
+    torchscript_artifact_path,
+)
+from .quantization import QUANTIZATION_MODES, load_static_artifact, static_artifact_path
+
 # --- Настройка логирования ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("vision_service")
 
 # --- Пути и настройки модели ---
-BASE_DIR = os.path.dirname(__file__)
-LABELS_FILE = os.path.join(BASE_DIR, "nutrition_db.json")
 MODEL_CACHE_DIR = os.path.expanduser("~/.cache/vision_service")
 MODEL_FILE = os.path.join(MODEL_CACHE_DIR, "efficientnet_b0_rwightman-7f5810bc.pth")
 MODEL_URL = "https://download.pytorch.org/models/efficientnet_b0_rwightman-7f5810bc.pth"
 MODEL_HASH = "7f5810bc"
 
+# Первая ступень каскада: MobileNetV3-Small, примерно в 7 раз дешевле EfficientNet-B0.
+FAST_MODEL_FILE = os.path.join(MODEL_CACHE_DIR, "mobilenet_v3_small-047dcff4.pth")
+FAST_MODEL_URL = "https://download.pytorch.org/models/mobilenet_v3_small-047dcff4.pth"
+FAST_MODEL_HASH = "047dcff4"
+
+_weights_loaded = False
+
 os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
 
 # --- Хеширование файла ---
@@ -37,88 +67,452 @@ def _sha256(path: str) -> str:
             h.update(chunk)
     return h.hexdigest()
 
+# --- Кэш проверки весов ---
+# Полный SHA-256 файла весов считается один раз; дальше достаточно сверить
+# размер, mtime и inode с записью в соседнем файле.
+def _file_signature(path: str) -> Dict[str, int]:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+def _read_verified_digest(path: str) -> Optional[str]:
+    try:
+        with open(path + ".verified.json", "r", encoding="utf-8") as f:
+            record = json.load(f)
+        if record.get("signature") != _file_signature(path):
+            return None
+    except (OSError, ValueError, AttributeError):
+        return None
+    return record.get("sha256")
+
+def _write_verified_digest(path: str, digest: str) -> None:
+    verified = path + ".verified.json"
+    tmp = verified + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"sha256": digest, "signature": _file_signature(path)}, f)
+        os.replace(tmp, verified)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить результат проверки весов: {e}")
+
 # --- Проверка и скачивание весов ---
-def _verify_or_download_weights():
+def _verify_or_download(path: str, url: str, hash_prefix: str) -> str:
     from torch.hub import download_url_to_file
-    if os.path.exists(MODEL_FILE):
-        digest = _sha256(MODEL_FILE)
-        if MODEL_HASH in digest:
-            return
+    if os.path.exists(path):
+        digest = _read_verified_digest(path)
+        if digest and hash_prefix in digest:
+            return digest
+        digest = _sha256(path)
+        if hash_prefix in digest:
+            _write_verified_digest(path, digest)
+            return digest
         try:
-            os.remove(MODEL_FILE)
+            os.remove(path)
         except OSError:
             logger.warning("Не удалось удалить повреждённый файл модели")
-    tmp = MODEL_FILE + ".tmp"
-    download_url_to_file(MODEL_URL, tmp, hash_prefix=MODEL_HASH)
-    os.replace(tmp, MODEL_FILE)
+    tmp = path + ".tmp"
+    download_url_to_file(url, tmp, hash_prefix=hash_prefix)
+    os.replace(tmp, path)
+    digest = _sha256(path)
+    _write_verified_digest(path, digest)
     logger.info("Вес модели загружен и проверен")
+    return digest
 
-# --- Загрузка модели и меток с кэшированием ---
-@lru_cache(maxsize=1)
-def _load_model():
-    # --- Загрузка меток ---
-    try:
-        with open(LABELS_FILE, "r", encoding="utf-8") as f:
-            label_map = json.load(f)
-        if not isinstance(label_map, list):
-            raise ValueError("nutrition_db.json должен быть списком блюд")
-    except (json.JSONDecodeError, FileNotFoundError, ValueError) as e:
-        logger.error(f"Ошибка загрузки меток: {e}")
-        label_map = []
-
-    # --- Проверка весов ---
-    _verify_or_download_weights()
-
-    # --- Загрузка модели ---
+def _verify_or_download_weights() -> str:
+    return _verify_or_download(MODEL_FILE, MODEL_URL, MODEL_HASH)
+
+# --- Eager-модель из файла весов ---
+def build_eager_model() -> torch.nn.Module:
+    global _weights_loaded
     model = models.efficientnet_b0(weights=None)
     try:
         state = torch.load(MODEL_FILE, map_location="cpu")
         model.load_state_dict(state)
-        model.eval()
+        _weights_loaded = True
     except Exception as e:
         logger.error(f"Ошибка загрузки весов модели: {e}")
+    return EmbeddingClassifier(model).eval()
 
-    # --- Трансформации изображений ---
-    tr = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485,0.456,0.406], std=[0.229,0.224,0.225]),
-    ])
+# --- Выбор бэкенда инференса ---
+def _load_static_int8(digest: str) -> Optional[InferenceBackend]:
+    global _weights_loaded
+    if config.BACKEND != "torchscript":
+        logger.warning("Статическая INT8-модель доступна только с бэкендом torchscript")
+        return None
+    module = load_static_artifact(static_artifact_path(MODEL_CACHE_DIR, digest))
+    if module is None:
+        logger.warning("INT8-модель недоступна, используем fp32")
+        return None
+    _weights_loaded = True
+    return TorchScriptBackend(module, quantization="static")
 
-    return model, tr, label_map
+def _load_torchscript(digest: str) -> InferenceBackend:
+    global _weights_loaded
+    path = torchscript_artifact_path(MODEL_CACHE_DIR, digest, config.CHANNELS_LAST)
+    module = load_torchscript(path)
+    if module is not None:
+        _weights_loaded = True
+        return TorchScriptBackend(module, channels_last=config.CHANNELS_LAST)
+    model = build_eager_model()
+    if _weights_loaded:
+        try:
+            module = export_torchscript(model, path, config.CHANNELS_LAST)
+            return TorchScriptBackend(module, channels_last=config.CHANNELS_LAST)
+        except Exception as e:
+            logger.warning(f"Не удалось подготовить артефакт модели: {e}")
+    return EagerBackend(model, channels_last=config.CHANNELS_LAST)
 
-# --- Классификация изображения ---
-def classify(image_bytes: bytes, topk: int = 3) -> List[dict]:
-    model, tr, label_map = _load_model()
-    results = []
+def _load_onnx(digest: str) -> InferenceBackend:
+    global _weights_loaded
+    path = onnx_artifact_path(MODEL_CACHE_DIR, digest)
+    model = None
+    try:
+        if not os.path.exists(path):
+            model = build_eager_model()
+            if not _weights_loaded:
+                return EagerBackend(model)
+            export_onnx(model, path)
+        backend = OnnxBackend(path, threads=torch.get_num_threads())
+        _weights_loaded = True
+        return backend
+    except Exception as e:
+        logger.error(f"ONNX Runtime недоступен, используем eager: {e}")
+    return EagerBackend(model if model is not None else build_eager_model())
+
+def _load_shared(digest: str) -> InferenceBackend:
+    global _weights_loaded
+    path = shared_weights_path(MODEL_CACHE_DIR, digest, config.CHANNELS_LAST)
+    state = load_shared_weights(path)
+    if state is None:
+        model = build_eager_model()
+        if not _weights_loaded:
+            return EagerBackend(model)
+        export_shared_weights(model, path, config.CHANNELS_LAST)
+        del model
+        state = load_shared_weights(path)
+        if state is None:
+            return EagerBackend(build_eager_model(), channels_last=config.CHANNELS_LAST)
+    # Модуль создаётся на meta-устройстве: своих тензоров у него нет,
+    # assign=True подставляет тензоры из отображённого файла без копирования.
+    with torch.device("meta"):
+        model = EmbeddingClassifier(models.efficientnet_b0(weights=None))
+    model.load_state_dict(state, assign=True)
+    _weights_loaded = True
+    backend = EagerBackend(model.eval(), channels_last=config.CHANNELS_LAST)
+    backend.shared_weights = True
+    return backend
+
+def _load_backend(digest: str) -> InferenceBackend:
+    if config.BACKEND not in BACKENDS:
+        logger.warning(f"Неизвестный бэкенд {config.BACKEND}, используем eager")
+    if config.QUANTIZATION not in QUANTIZATION_MODES:
+        logger.warning(f"Неизвестный режим квантизации {config.QUANTIZATION}, используем fp32")
 
+    if config.SHARED_WEIGHTS:
+        # Замороженный TorchScript и ONNX Runtime хранят веса своими копиями,
+        # поэтому общий файл исполняется eager-моделью.
+        if config.BACKEND == "onnx" or config.QUANTIZATION == "static":
+            logger.warning("Общие веса доступны только для fp32 с бэкендами eager и torchscript, процесс загрузит свою копию")
+        else:
+            return _load_shared(digest)
+
+    if config.QUANTIZATION == "static":
+        backend = _load_static_int8(digest)
+        if backend is not None:
+            return backend
+
+    if config.BACKEND == "torchscript":
+        return _load_torchscript(digest)
+    if config.BACKEND == "onnx":
+        return _load_onnx(digest)
+    return EagerBackend(build_eager_model(), channels_last=config.CHANNELS_LAST)
+
+# --- Быстрая модель первой ступени каскада ---
+def _load_fast_backend() -> Optional[InferenceBackend]:
     try:
-        img = Image.open(BytesIO(image_bytes)).convert("RGB")
-    except UnidentifiedImageError:
-        logger.error("Невозможно открыть изображение")
-        return results
+        digest = _verify_or_download(FAST_MODEL_FILE, FAST_MODEL_URL, FAST_MODEL_HASH)
+        path = torchscript_artifact_path(MODEL_CACHE_DIR, digest, config.CHANNELS_LAST, arch="mobilenet_v3_small")
+        module = load_torchscript(path)
+        if module is None:
+            model = models.mobilenet_v3_small(weights=None)
+            model.load_state_dict(torch.load(FAST_MODEL_FILE, map_location="cpu"))
+            module = export_torchscript(EmbeddingClassifier(model).eval(), path, config.CHANNELS_LAST)
     except Exception as e:
-        logger.error(f"Ошибка при обработке изображения: {e}")
-        return results
+        logger.error(f"Быстрая модель каскада недоступна, все изображения идут в EfficientNet: {e}")
+        return None
+    return TorchScriptBackend(module, channels_last=config.CHANNELS_LAST)
+
+class LoadedModel(NamedTuple):
+    backend: InferenceBackend
+    projections: ProjectionSource
+    knn_index: Optional[EmbeddingIndex]
+    portion_head: Optional[PortionHead]
+    fast_backend: Optional[InferenceBackend]
+
+def prepare_artifacts() -> None:
+    """Verifies the weights and builds the backend's artifact once, before worker processes start.
+
+    Workers then only load or map a finished file instead of racing to
+    download and export it.
+    """
+    _load_backend(_verify_or_download_weights())
+
+# --- Загрузка модели и меток с кэшированием ---
+@lru_cache(maxsize=1)
+def _load_model() -> LoadedModel:
+    # --- Доля ядер этого процесса ---
+    if config.TORCH_THREADS:
+        torch.set_num_threads(config.TORCH_THREADS)
+
+    # --- Проекция классов ImageNet на блюда (перестраивается при изменении файла) ---
+    projections = ProjectionSource(shared_store(), EfficientNet_B0_Weights.IMAGENET1K_V1.meta["categories"])
+
+    # --- Проверка весов и загрузка модели ---
+    digest = _verify_or_download_weights()
+    backend = _load_backend(digest)
+
+    # --- kNN по эмбеддингам эталонных фото блюд ---
+    knn_index = None
+    if config.KNN_INDEX:
+        try:
+            knn_index = EmbeddingIndex.load(config.KNN_INDEX, mmap=config.KNN_MMAP, chunk_rows=config.KNN_CHUNK_ROWS)
+            logger.info(f"kNN-индекс загружен: {len(knn_index)} эталонов, {len(knn_index.dishes)} блюд")
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось загрузить kNN-индекс, используем проекцию ImageNet: {e}")
+
+    # --- Голова оценки порции на том же эмбеддинге ---
+    portion_head = load_portion_head(config.PORTION_HEAD, EMBEDDING_DIM)
+
+    # --- Каскад: дешёвая модель отвечает сама, если уверена ---
+    fast_backend = _load_fast_backend() if config.CASCADE_THRESHOLD > 0 else None
+
+    return LoadedModel(backend, projections, knn_index, portion_head, fast_backend)
 
-    x = tr(img).unsqueeze(0)  # (1, C, H, W)
+# --- Прогрев модели ---
+def model_info() -> Dict[str, object]:
+    model = _load_model()
+    return {
+        "weights_loaded": _weights_loaded,
+        "classifier": "knn" if model.knn_index is not None else "projection",
+        "portion": "regression" if model.portion_head is not None else "standard",
+        "cascade": "mobilenet_v3_small" if model.fast_backend is not None else "off",
+        **model.backend.info(),
+    }
 
+def warmup(iterations: int = 2) -> Dict[str, object]:
+    # Первые прогоны выделяют память и дают JIT собрать оптимизированный граф.
+    model = _load_model()
+    x = torch.zeros((1, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    for _ in range(iterations):
+        model.backend(x)
+        if model.fast_backend is not None:
+            model.fast_backend(x)
+    return model_info()
+
+# --- Декодирование изображения в слот батча ---
+def _decode_into(image_bytes: bytes, out: torch.Tensor, stages: Optional[Dict[str, List[float]]] = None) -> bool:
     try:
-        with torch.no_grad():
-            logits = model(x)
-            probs = torch.nn.functional.softmax(logits, dim=-1)[0]
-            top = torch.topk(probs, k=min(topk, probs.shape[0]))
+        started = time.perf_counter()
+        img = decode(image_bytes)
+        decoded = time.perf_counter()
+        to_tensor(img, out=out)
+        if stages is not None:
+            stages["decode"].append(decoded - started)
+            stages["transform"].append(time.perf_counter() - decoded)
+    except ImageRejected as e:
+        logger.error(str(e))
+        return False
     except Exception as e:
-        logger.error(f"Ошибка при предсказании модели: {e}")
-        return results
+        logger.error(f"Ошибка при обработке изображения: {e}")
+        return False
+    return True
 
-    for score, idx in zip(top.values.tolist(), top.indices.tolist()):
-        meta = label_map[idx] if idx < len(label_map) else {"name": str(idx), "calories": None}
+# --- Преобразование оценок блюд в кандидатов ---
+def _to_candidates(scores: List[float], indices: List[int], dishes: list) -> List[dict]:
+    # Softmax не бывает нулевым: без порога любое фото, хоть кота, получило бы блюдо.
+    results = []
+    for score, idx in zip(scores, indices):
+        if score <= 0 or score < config.MIN_DISH_CONFIDENCE:
+            break
+        meta = dishes[idx]
         results.append({
             "name": meta.get("name"),
             "confidence": float(score),
             "calories": meta.get("calories")
         })
-
     return results
+
+# --- Пакетная классификация изображений ---
+def _empty_prediction() -> Dict[str, object]:
+    return {"candidates": [], "portion_grams": None, "tier": None}
+
+def _project(projection, probs: torch.Tensor, topk: int) -> List[List[dict]]:
+    # Вероятности классов ImageNet -> оценки блюд одним умножением на весь батч.
+    dish_scores = projection.scores(probs)
+    top = torch.topk(dish_scores, k=min(topk, dish_scores.shape[-1]), dim=-1)
+    return [
+        _to_candidates(scores, indices, projection.dishes)
+        for scores, indices in zip(top.values.tolist(), top.indices.tolist())
+    ]
+
+def _score(
+    model: LoadedModel, projection, embeddings, logits: torch.Tensor, topk: int
+) -> List[List[dict]]:
+    """Dish candidates for every row of a forward's output."""
+    if model.knn_index is not None:
+        table = projection.table
+        results = []
+        for candidates in model.knn_index.classify(embeddings, k=config.KNN_K, topk=topk):
+            row = []
+            for name, score in candidates:
+                dish_id = table.lookup(name)
+                calories = table.dishes[dish_id].get("calories") if dish_id is not None else None
+                row.append({"name": name, "confidence": score, "calories": calories})
+            results.append(row)
+        return results
+    return _project(projection, torch.nn.functional.softmax(logits, dim=-1), topk)
+
+def _cascade(
+    model: LoadedModel, projection, batch: torch.Tensor, topk: int, results: List[Dict[str, object]], positions: List[int]
+) -> List[int]:
+    """Answers what the fast model is sure about, rejects non-food; returns the batch rows left for EfficientNet.
+
+    Accepted images keep the projection candidates of the fast model and no
+    ``portion_grams`` (the portion head reads EfficientNet embeddings).
+    """
+    _, logits = model.fast_backend(batch)
+    probs = torch.nn.functional.softmax(logits, dim=-1)
+    confidence = projection.scores(probs).max(dim=-1).values if projection.dishes else torch.zeros(len(probs))
+    accepted = confidence >= config.CASCADE_THRESHOLD
+    nonfood = ~accepted & (projection.food_mass(probs) < config.CASCADE_NONFOOD_MASS)
+
+    rows = accepted.nonzero().flatten().tolist()
+    for row, candidates in zip(rows, _project(projection, probs[rows], topk) if rows else []):
+        results[positions[row]].update(candidates=candidates, tier="fast")
+    for row in nonfood.nonzero().flatten().tolist():
+        results[positions[row]]["tier"] = "nonfood"
+    return (~(accepted | nonfood)).nonzero().flatten().tolist()
+
+def classify_batch(images: Sequence[bytes], topk: int = 3) -> List[Dict[str, object]]:
+    """Classify several images with a single (N, C, H, W) forward pass.
+
+    Each prediction holds dish ``candidates`` and ``portion_grams``; both
+    heads read the same embeddings, so the portion estimate needs no extra
+    forward. ``portion_grams`` is None without a portion head. ``tier`` names
+    what produced the answer: ``blank`` or ``nonfood`` (rejected, no
+    candidates), ``fast`` (the cascade's small model) or ``full``
+    (EfficientNet). Results are returned in input order; undecodable images
+    get no candidates and no tier.
+    """
+    return classify_batch_timed(images, topk)[0]
+
+def classify_batch_timed(
+    images: Sequence[bytes], topk: int = 3
+) -> Tuple[List[Dict[str, object]], Dict[str, List[float]]]:
+    """``classify_batch`` plus stage durations in seconds.
+
+    The durations are returned rather than recorded here so that they reach
+    the metrics of the serving process from process-pool workers too.
+    """
+    stages: Dict[str, List[float]] = {"decode": [], "transform": [], "forward_fast": [], "forward": [], "postprocess": []}
+    model = _load_model()
+    projection = model.projections.current()
+    results = [_empty_prediction() for _ in images]
+    if not projection.dishes and model.knn_index is None:
+        return results, stages
+
+    # Изображения декодируются сразу в общий буфер (N, C, H, W), без torch.stack.
+    batch = torch.empty((len(images), 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    positions = []
+    for pos, image_bytes in enumerate(images):
+        if _decode_into(image_bytes, batch[len(positions)], stages):
+            positions.append(pos)
+    if not positions:
+        return results, stages
+    batch = batch[: len(positions)]
+
+    # --- Пустые и однотонные кадры не доходят ни до одной модели ---
+    if config.PREFILTER_BLANK_STD > 0:
+        # Разброс по пикселям внутри каждого канала: у однотонного кадра он близок к нулю во всех.
+        blank = batch.flatten(2).std(dim=2).amax(dim=1) < config.PREFILTER_BLANK_STD
+        if blank.any():
+            for row in blank.nonzero().flatten().tolist():
+                results[positions[row]]["tier"] = "blank"
+            keep = (~blank).nonzero().flatten()
+            batch = batch[keep]
+            positions = [positions[row] for row in keep.tolist()]
+
+    if model.fast_backend is not None and positions:
+        try:
+            started = time.perf_counter()
+            rows = _cascade(model, projection, batch, topk, results, positions)
+            stages["forward_fast"].append(time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Ошибка быстрой модели каскада, используем EfficientNet: {e}")
+            rows = list(range(len(positions)))
+        if len(rows) < len(positions):
+            batch = batch[rows]
+            positions = [positions[row] for row in rows]
+    if not positions:
+        return results, stages
+
+    try:
+        started = time.perf_counter()
+        embeddings, logits = model.backend(batch)
+        forwarded = time.perf_counter()
+        embeddings = embeddings.numpy()
+        candidates = _score(model, projection, embeddings, logits, topk)
+        portions = model.portion_head.predict(embeddings).tolist() if model.portion_head is not None else None
+        stages["forward"].append(forwarded - started)
+        stages["postprocess"].append(time.perf_counter() - forwarded)
+    except Exception as e:
+        logger.error(f"Ошибка при предсказании модели: {e}")
+        return results, stages
+
+    for i, pos in enumerate(positions):
+        results[pos]["candidates"] = candidates[i]
+        results[pos]["tier"] = "full"
+        if portions is not None:
+            results[pos]["portion_grams"] = round(portions[i])
+
+    return results, stages
+
+# --- Анализ тарелки по сетке кропов ---
+def classify_plate(image_bytes: bytes, grid: int = 3) -> List[Dict[str, object]]:
+    """Top dish of each of ``grid`` x ``grid`` overlapping crops, from one batched forward.
+
+    The frame is decoded and normalized once; the crops are views into it,
+    materialized only as the single (grid * grid, C, H, W) model input.
+    Raises ``ImageRejected`` for unusable images.
+    """
+    model = _load_model()
+    projection = model.projections.current()
+    if not projection.dishes and model.knn_index is None:
+        return []
+    frame = to_tensor(decode_tiled(image_bytes, grid))
+    views, boxes = tile_views(frame, grid)
+    # Единственная копия — сборка входного батча из представлений кропов.
+    batch = views.reshape(len(boxes), 3, CROP_SIZE, CROP_SIZE)
+
+    try:
+        embeddings, logits = model.backend(batch)
+        embeddings = embeddings.numpy()
+        candidates = _score(model, projection, embeddings, logits, topk=1)
+        portions = model.portion_head.predict(embeddings).tolist() if model.portion_head is not None else None
+    except Exception as e:
+        logger.error(f"Ошибка при предсказании модели: {e}")
+        return []
+
+    detections = []
+    for i, (crop_candidates, box) in enumerate(zip(candidates, boxes)):
+        if not crop_candidates:
+            continue
+        detections.append({
+            **crop_candidates[0],
+            "box": box,
+            "portion_grams": round(portions[i]) if portions is not None else None,
+        })
+    return detections
+
+# --- Классификация изображения ---
+def classify(image_bytes: bytes, topk: int = 3) -> Dict[str, object]:
+    return classify_batch([image_bytes], topk=topk)[0]
@@ -0,0 +1,139 @@
+"""Embedding k-nearest-neighbour dish classifier over reference photos."""
+
+import json
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger("vision_service")
+
+VECTORS_FILE = "vectors.npy"
+LABELS_FILE = "labels.npy"
+DISHES_FILE = "dishes.json"
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """Cosine-similarity kNN over L2-normalized reference embeddings.
+
+    References live in one contiguous float32 (M, D) matrix, optionally
+    memory-mapped from disk. A search scans it in ``chunk_rows`` blocks: each
+    block is a single (N, D) x (D, chunk) GEMM for the whole query batch,
+    followed by ``argpartition`` to keep only the running top-k, so extra
+    memory stays O(N * chunk_rows) regardless of the reference set size.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        labels: np.ndarray,
+        dishes: List[str],
+        chunk_rows: int = 16384,
+    ):
+        if vectors.ndim != 2 or len(vectors) != len(labels):
+            raise ValueError("Размеры векторов и меток kNN-индекса не совпадают")
+        self.vectors = vectors
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.dishes = dishes
+        self.chunk_rows = max(1, chunk_rows)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, chunk_rows: int = 16384) -> "EmbeddingIndex":
+        vectors = np.load(os.path.join(directory, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        labels = np.load(os.path.join(directory, LABELS_FILE))
+        with open(os.path.join(directory, DISHES_FILE), "r", encoding="utf-8") as f:
+            dishes = json.load(f)
+        return cls(vectors, labels, dishes, chunk_rows=chunk_rows)
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временные файлы: старый vectors.npy может быть открыт через mmap.
+        vectors_tmp = os.path.join(directory, VECTORS_FILE + ".tmp")
+        labels_tmp = os.path.join(directory, LABELS_FILE + ".tmp")
+        dishes_tmp = os.path.join(directory, DISHES_FILE + ".tmp")
+        with open(vectors_tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        with open(labels_tmp, "wb") as f:
+            np.save(f, self.labels)
+        with open(dishes_tmp, "w", encoding="utf-8") as f:
+            json.dump(self.dishes, f, ensure_ascii=False)
+        os.replace(vectors_tmp, os.path.join(directory, VECTORS_FILE))
+        os.replace(labels_tmp, os.path.join(directory, LABELS_FILE))
+        os.replace(dishes_tmp, os.path.join(directory, DISHES_FILE))
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-``k`` similarities and reference rows for each query, best first."""
+        queries = normalize(queries)
+        n = len(queries)
+        k = min(k, len(self))
+        best_sims = np.full((n, k), -np.inf, dtype=np.float32)
+        best_rows = np.full((n, k), -1, dtype=np.int64)
+        if not k:
+            return best_sims, best_rows
+        rows = np.arange(n)[:, None]
+
+        for start in range(0, len(self), self.chunk_rows):
+            block = self.vectors[start : start + self.chunk_rows]
+            sims = queries @ block.T  # (n, chunk)
+            kk = min(k, sims.shape[1])
+            part = np.argpartition(sims, -kk, axis=1)[:, -kk:]
+            # Сливаем кандидатов блока с текущим top-k и снова оставляем k лучших.
+            merged_sims = np.concatenate([best_sims, sims[rows, part]], axis=1)
+            merged_rows = np.concatenate([best_rows, part + start], axis=1)
+            keep = np.argpartition(merged_sims, -k, axis=1)[:, -k:]
+            best_sims = merged_sims[rows, keep]
+            best_rows = merged_rows[rows, keep]
+
+        order = np.argsort(-best_sims, axis=1)
+        return best_sims[rows, order], best_rows[rows, order]
+
+    def classify(self, queries: np.ndarray, k: int, topk: int) -> List[List[Tuple[str, float]]]:
+        """Similarity-weighted vote of the ``k`` nearest references per query."""
+        sims, rows = self.search(queries, k)
+        results = []
+        for query_sims, query_rows in zip(sims, rows):
+            votes = np.zeros(len(self.dishes), dtype=np.float64)
+            valid = query_rows >= 0
+            np.add.at(votes, self.labels[query_rows[valid]], np.clip(query_sims[valid], 0, None))
+            total = votes.sum()
+            if total <= 0:
+                results.append([])
+                continue
+            top = np.argsort(-votes)[:topk]
+            results.append([(self.dishes[i], float(votes[i] / total)) for i in top if votes[i] > 0])
+        return results
+
+
+def build_index(
+    embeddings: np.ndarray, dish_names: Sequence[str], base: Optional[EmbeddingIndex] = None
+) -> EmbeddingIndex:
+    """New index from reference embeddings, optionally appended to ``base``."""
+    dishes = list(base.dishes) if base is not None else []
+    positions = {name: i for i, name in enumerate(dishes)}
+    labels = []
+    for name in dish_names:
+        if name not in positions:
+            positions[name] = len(dishes)
+            dishes.append(name)
+        labels.append(positions[name])
+    vectors = normalize(embeddings)
+    labels_arr = np.asarray(labels, dtype=np.int32)
+    if base is not None:
+        vectors = np.concatenate([np.asarray(base.vectors, dtype=np.float32), vectors])
+        labels_arr = np.concatenate([base.labels, labels_arr])
+    return EmbeddingIndex(vectors, labels_arr, dishes)
@@ -0,0 +1,193 @@
+"""Minimal in-process metrics rendered in the Prometheus text format.
+
+All observations happen on the event loop (worker timings are shipped back
+with batch results), so the collectors need no locks and an observation is
+a bisect plus two additions.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Collection, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+Value = Union[int, float]
+
+
+def _escape(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: Mapping[str, object]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + "}"
+
+
+def _format(value: Value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        # label value -> [counts per bucket (+Inf last)..., sum]
+        self._series: Dict[Optional[str], List[float]] = {}
+
+    def observe(self, value: float, label: Optional[str] = None) -> None:
+        series = self._series.get(label)
+        if series is None:
+            series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def observe_many(self, values: Iterable[float], label: Optional[str] = None) -> None:
+        for value in values:
+            self.observe(value, label)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label, series in sorted(self._series.items(), key=lambda item: item[0] or ""):
+            base = {self.label: label} if self.label else {}
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format(bound)
+                lines.append(f"{self.name}_bucket{_labels({**base, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(base)} {_format(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(base)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._values: Dict[Optional[str], Value] = {}
+
+    def inc(self, label: Optional[str] = None, amount: Value = 1) -> None:
+        self._values[label] = self._values.get(label, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label, value in sorted(self._values.items(), key=lambda item: item[0] or ""):
+            lines.append(f"{self.name}{_labels({self.label: label} if self.label else {})} {_format(value)}")
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time from ``fn``; a mapping yields one sample per label set."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], Union[Value, Mapping[tuple, Value]]],
+        labels: Sequence[str] = (),
+        kind: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        value = self.fn()
+        if isinstance(value, Mapping):
+            for label_values, sample in value.items():
+                lines.append(f"{self.name}{_labels(dict(zip(self.labels, label_values)))} {_format(sample)}")
+        else:
+            lines.append(f"{self.name} {_format(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._collectors: Dict[str, Union[Histogram, Counter, Gauge]] = {}
+
+    def register(self, collector: Union[Histogram, Counter, Gauge]) -> Union[Histogram, Counter, Gauge]:
+        self._collectors[collector.name] = collector
+        return collector
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for collector in self._collectors.values():
+            lines.extend(collector.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "vision_stage_seconds",
+    "Latency of pipeline stages: upload_read, decode, transform (per image); forward_fast, forward, postprocess (per batch); macros (per request).",
+    LATENCY_BUCKETS,
+    label="stage",
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "vision_request_seconds",
+    "End-to-end handler latency by endpoint.",
+    LATENCY_BUCKETS,
+    label="endpoint",
+))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "vision_batch_size",
+    "Number of images per model forward.",
+    BATCH_SIZE_BUCKETS,
+))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "vision_queue_wait_seconds",
+    "Time an image waited in the micro-batcher queue before its batch started.",
+    LATENCY_BUCKETS,
+))
+SHED_REQUESTS = REGISTRY.register(Counter(
+    "vision_shed_requests_total",
+    "Requests answered without a result: queue_full (429), deadline (504), disconnected.",
+    label="reason",
+))
+
+CASCADE_TIERS = REGISTRY.register(Counter(
+    "vision_cascade_total",
+    "Model-evaluated images by the tier that answered: blank, nonfood (rejected), fast (small model), full (EfficientNet).",
+    label="tier",
+))
+
+
+def record_stages(stages: Mapping[str, Sequence[float]]) -> None:
+    for stage, values in stages.items():
+        STAGE_SECONDS.observe_many(values, stage)
+
+
+class UploadTimer:
+    """ASGI middleware recording the ``upload_read`` stage for POSTs to ``paths``.
+
+    The stage runs from the start of the request to its last body chunk.
+    Multipart forms are parsed before the handler is called, so only the
+    server's ``receive`` sees how long the upload itself took.
+    """
+
+    def __init__(self, app: Any, paths: Collection[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def timed_receive():
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                STAGE_SECONDS.observe(time.perf_counter() - started, "upload_read")
+            return message
+
+        await self.app(scope, timed_receive, send)
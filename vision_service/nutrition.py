@@ -0,0 +1,161 @@
+"""Immutable, array-backed nutrition table shared by the model and the macro calculator."""
+
+import json
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger("vision_service")
+
+DB_FILE = os.path.join(os.path.dirname(__file__), "nutrition_db.json")
+
+# Порядок строк в матрице макронутриентов.
+MACROS = ("calories_kcal", "proteins_g", "fats_g", "carbs_g")
+# В nutrition_db.json поле "calories" — ккал на стандартную порцию этого веса.
+DEFAULT_PORTION_GRAMS = 200
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+")
+
+
+def tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def compound(text: str) -> str:
+    """Phrase key: lower-case letters only, no separators ("Ice cream", "ice-cream" -> "icecream")."""
+    return "".join(tokens(text))
+
+
+def forms(term: str) -> Set[str]:
+    # Без полноценной лемматизации: достаточно совпадения по множественному числу.
+    result = {term}
+    if term.endswith("s") and len(term) > 3:
+        result.add(term[:-1])
+    if term.endswith("es") and len(term) > 4:
+        result.add(term[:-2])
+    return result
+
+
+def _per_100g(entry: Dict[str, object]) -> List[float]:
+    # Явные значения на 100 г, если они есть; иначе калорийность порции
+    # пересчитывается на 100 г, а неизвестные БЖУ остаются NaN.
+    if entry.get("calories_kcal") is not None:
+        return [float(entry.get(name, np.nan)) for name in MACROS]
+    calories = entry.get("calories")
+    portion = float(entry.get("portion_grams") or DEFAULT_PORTION_GRAMS)
+    per_100g = float(calories) * 100 / portion if calories is not None else np.nan
+    return [per_100g, np.nan, np.nan, np.nan]
+
+
+class NutritionTable:
+    """Read-only snapshot of the dish file.
+
+    Dish ``i`` is row ``i`` everywhere: ``dishes[i]`` is the raw entry and
+    ``per_100g[:, i]`` its macros. ``per_100g`` is a C-contiguous (4, D)
+    float32 matrix, so each macro is one contiguous column over all dishes.
+    """
+
+    def __init__(self, dishes: List[Dict[str, object]], version: Optional[int] = None):
+        self.dishes = dishes
+        self.version = version
+        self.names: Tuple[str, ...] = tuple(str(dish.get("name") or "") for dish in dishes)
+        self.ids: Dict[str, int] = {}
+        for i, name in enumerate(self.names):
+            self.ids.setdefault(name, i)
+            self.ids.setdefault(name.lower(), i)
+        self.per_100g = np.ascontiguousarray(
+            np.array([_per_100g(dish) for dish in dishes], dtype=np.float32).reshape(len(dishes), len(MACROS)).T
+        )
+        self.portion_grams = np.array(
+            [float(dish.get("portion_grams") or DEFAULT_PORTION_GRAMS) for dish in dishes], dtype=np.float32
+        )
+        # Ключевое слово хранится целой фразой без разделителей: «ice cream» и «icecream» совпадают.
+        index: Dict[str, List[int]] = {}
+        for i, dish in enumerate(dishes):
+            for keyword in dish.get("keywords") or []:
+                for form in forms(compound(str(keyword))):
+                    if form and i not in index.setdefault(form, []):
+                        index[form].append(i)
+        self.keyword_index: Dict[str, np.ndarray] = {
+            term: np.array(ids, dtype=np.int32) for term, ids in index.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.dishes)
+
+    def lookup(self, name: Optional[str]) -> Optional[int]:
+        if not name:
+            return None
+        dish_id = self.ids.get(name)
+        return dish_id if dish_id is not None else self.ids.get(name.lower())
+
+    def match(self, terms: Iterable[str]) -> np.ndarray:
+        """Ids of dishes having a keyword equal to one of ``terms``."""
+        hits = [self.keyword_index[term] for term in terms if term in self.keyword_index]
+        if not hits:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(hits))
+
+    def macros(self, dish_ids: Sequence[int], grams: Sequence[float]) -> np.ndarray:
+        """(4, N) macros for N (dish, grams) pairs in one vectorized gather and multiply."""
+        ids = np.asarray(dish_ids, dtype=np.intp)
+        factor = np.asarray(grams, dtype=np.float32) / 100
+        return self.per_100g[:, ids] * factor
+
+
+class NutritionStore:
+    """Serves the current ``NutritionTable``, swapping in a new one when the file's mtime changes.
+
+    The reload happens in whichever thread notices the change first; other
+    threads keep using the previous snapshot instead of waiting for it. A
+    table is never mutated after construction, so readers need no lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._table = NutritionTable([])
+        self._mtime_ns: Optional[int] = None
+        self._reload_lock = threading.Lock()
+        self.current()
+
+    def current(self) -> NutritionTable:
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logger.error(f"Ошибка загрузки базы блюд: {e}")
+            return self._table
+        if mtime_ns != self._mtime_ns and self._reload_lock.acquire(blocking=False):
+            try:
+                if mtime_ns != self._mtime_ns:
+                    self._reload(mtime_ns)
+            finally:
+                self._reload_lock.release()
+        return self._table
+
+    def _reload(self, mtime_ns: int) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                dishes = json.load(f)
+            if not isinstance(dishes, list):
+                raise ValueError("nutrition_db.json должен быть списком блюд")
+            table = NutritionTable(dishes, version=mtime_ns)
+        except (json.JSONDecodeError, OSError, TypeError, ValueError) as e:
+            # Остаёмся на предыдущей таблице, но не перечитываем файл на каждом запросе.
+            logger.error(f"Ошибка загрузки базы блюд: {e}")
+            self._mtime_ns = mtime_ns
+            return
+        # Одно присваивание ссылки: читатели видят либо старую, либо новую таблицу целиком.
+        self._table = table
+        self._mtime_ns = mtime_ns
+        logger.info("База блюд загружена: %s блюд, %s ключевых слов", len(table), len(table.keyword_index))
+
+
+@lru_cache(maxsize=1)
+def shared_store() -> NutritionStore:
+    return NutritionStore(DB_FILE)
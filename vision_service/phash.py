@@ -0,0 +1,104 @@
+"""Perceptual-hash (dHash) index for near-duplicate meal photos."""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from . import config
+from .preprocessing import ImageBuffer, open_buffer
+
+
+HASH_SIZE = 8  # 8x8 = 64 бита
+# Хеш гладкого градиента или почти однотонного кадра — почти все нули или единицы:
+# такие хеши совпадают у совершенно разных фото, поэтому в индекс не попадают.
+MIN_SET_BITS = 8
+# Сравнения соседних пикселей с разницей меньше 2 уровней серого решает шум JPEG.
+MIN_GRADIENT = 2
+MIN_DECISIVE_BITS = 16
+
+# Таблица числа единичных битов для каждого байта.
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image_bytes: ImageBuffer) -> Optional[int]:
+    """64-bit difference hash, robust to re-encoding and rescaling.
+
+    None for undecodable images and for low-texture ones whose hash would be
+    degenerate: fewer than ``MIN_SET_BITS`` zeros or ones, or fewer than
+    ``MIN_DECISIVE_BITS`` neighbour comparisons that are not decided by noise.
+    """
+    try:
+        img = Image.open(open_buffer(image_bytes))
+        # Для JPEG декодируем сразу в уменьшенном масштабе: полный кадр не нужен.
+        img.draft("L", (HASH_SIZE * 16, HASH_SIZE * 16))
+        img = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    except Exception:
+        return None
+    pixels = np.asarray(img, dtype=np.int16)
+    diffs = pixels[:, 1:] - pixels[:, :-1]
+    bits = (diffs > 0).ravel()
+    set_bits = int(bits.sum())
+    if not MIN_SET_BITS <= set_bits <= bits.size - MIN_SET_BITS:
+        return None
+    if int((np.abs(diffs) >= MIN_GRADIENT).sum()) < MIN_DECISIVE_BITS:
+        return None
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hamming_distances(hashes: np.ndarray, value: int) -> np.ndarray:
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return _POPCOUNT8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+class PerceptualIndex:
+    """Fixed-capacity ring buffer of hashes with a linear Hamming scan.
+
+    Hashes live in one contiguous ``uint64`` array, so a lookup is a single
+    vectorized XOR + popcount over at most ``capacity`` elements.
+    """
+
+    def __init__(self, capacity: int = 4096, max_distance: int = config.PHASH_MAX_DISTANCE):
+        self.capacity = max(0, capacity)
+        self.max_distance = max_distance
+        self._hashes = np.zeros(self.capacity, dtype=np.uint64)
+        self._values: List[Optional[Dict[str, Any]]] = [None] * self.capacity
+        self._size = 0
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value_hash: int, value: Dict[str, Any]) -> None:
+        if not self.capacity:
+            return
+        self._hashes[self._next] = value_hash
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def lookup(self, value_hash: int) -> Optional[Dict[str, Any]]:
+        if not self._size:
+            self.misses += 1
+            return None
+        distances = hamming_distances(self._hashes[: self._size], value_hash)
+        pos = int(np.argmin(distances))
+        if distances[pos] > self.max_distance:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._values[pos]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": self._size,
+            "capacity": self.capacity,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "bytes": self._hashes.nbytes,
+        }
@@ -0,0 +1,75 @@
+"""Plate analysis: overlapping crops of one decoded frame and merging of their detections."""
+
+from typing import Dict, List, Sequence, Tuple
+
+import torch
+
+from .preprocessing import CROP_SIZE
+
+
+Box = Tuple[float, float, float, float]
+
+
+def tile_views(frame: torch.Tensor, grid: int) -> Tuple[torch.Tensor, List[Box]]:
+    """``grid`` x ``grid`` overlapping ``CROP_SIZE`` crops of a (C, H, W) frame.
+
+    The crops are a zero-copy ``unfold`` view of ``frame`` shaped
+    (grid, grid, C, CROP_SIZE, CROP_SIZE); the frame size must come from
+    ``preprocessing.tiled_size`` so that the strides are whole pixels. Boxes
+    are (x0, y0, x1, y1) in fractions of the frame, in row-major crop order.
+    """
+    _, height, width = frame.shape
+    if grid <= 1:
+        return frame[None, None], [(0.0, 0.0, 1.0, 1.0)]
+    stride_y = (height - CROP_SIZE) // (grid - 1)
+    stride_x = (width - CROP_SIZE) // (grid - 1)
+    # (C, gy, gx, S, S) -> (gy, gx, C, S, S): только перестановка шагов, данные не копируются.
+    views = frame.unfold(1, CROP_SIZE, stride_y).unfold(2, CROP_SIZE, stride_x).permute(1, 2, 0, 3, 4)
+    boxes = [
+        (x * stride_x / width, y * stride_y / height, (x * stride_x + CROP_SIZE) / width, (y * stride_y + CROP_SIZE) / height)
+        for y in range(grid)
+        for x in range(grid)
+    ]
+    return views, boxes
+
+
+def iou(a: Box, b: Box) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    if inter <= 0:
+        return 0.0
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union
+
+
+def merge_detections(detections: Sequence[Dict[str, object]], nms_iou: float) -> List[Dict[str, object]]:
+    """Greedy merge of per-crop detections, most confident first.
+
+    A detection joins a kept item with the same label whose box it overlaps
+    (the item's box grows to cover both); it is dropped if it overlaps an item
+    with a different label by at least ``nms_iou``; otherwise it starts a new item.
+    """
+    items: List[Dict[str, object]] = []
+    for det in sorted(detections, key=lambda d: d["confidence"], reverse=True):
+        box = det["box"]
+        target = None
+        suppressed = False
+        for item in items:
+            overlap = iou(box, item["box"])
+            if item["name"] == det["name"] and overlap > 0:
+                target = item
+                break
+            if overlap >= nms_iou:
+                suppressed = True
+        if target is not None:
+            target["box"] = (
+                min(target["box"][0], box[0]),
+                min(target["box"][1], box[1]),
+                max(target["box"][2], box[2]),
+                max(target["box"][3], box[3]),
+            )
+            target["crops"] += 1
+        elif not suppressed:
+            items.append({**det, "crops": 1})
+    return items
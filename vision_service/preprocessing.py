@@ -0,0 +1,167 @@
+"""Fast decode + fused resize/crop/normalize for model input."""
+
+import io
+from io import BytesIO
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+from . import config
+
+
+RESIZE_SIZE = 256
+CROP_SIZE = 224
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+# x_norm = (x / 255 - mean) / std = x * scale - shift, по каналам в раскладке HWC.
+_SCALE = np.array([1.0 / (255.0 * s) for s in STD], dtype=np.float32)
+_SHIFT = np.array([m / s for m, s in zip(MEAN, STD)], dtype=np.float32)
+
+# Режимы, которые PIL умеет масштабировать без предварительной конвертации.
+_RESIZABLE_MODES = {"RGB", "RGBA", "L", "CMYK", "YCbCr"}
+
+
+ImageBuffer = Union[bytes, bytearray, memoryview]
+
+
+class MemoryReader(io.RawIOBase):
+    """Seekable read-only file over a memoryview; unlike ``BytesIO`` it does not copy the buffer."""
+
+    def __init__(self, data: ImageBuffer):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        buffer[:n] = self._view[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def open_buffer(data: ImageBuffer) -> io.IOBase:
+    # BytesIO разделяет память с неизменяемым bytes, а любой другой буфер скопировал бы.
+    if isinstance(data, bytes):
+        return BytesIO(data)
+    return io.BufferedReader(MemoryReader(data))
+
+
+class ImageRejected(ValueError):
+    def __init__(self, message: str, too_large: bool = False):
+        super().__init__(message)
+        self.too_large = too_large
+
+
+def _open(image_bytes: ImageBuffer) -> Image.Image:
+    try:
+        img = Image.open(open_buffer(image_bytes))
+    except Exception as e:
+        raise ImageRejected(f"Невозможно открыть изображение: {e}") from e
+    width, height = img.size
+    # Размеры известны из заголовка: проверяем их до распаковки пикселей.
+    if width <= 0 or height <= 0:
+        raise ImageRejected("Некорректный размер изображения")
+    if max(width, height) > config.MAX_IMAGE_SIDE or width * height > config.MAX_IMAGE_PIXELS:
+        raise ImageRejected(f"Изображение слишком большое: {width}x{height}", too_large=True)
+    return img
+
+
+def probe(image_bytes: ImageBuffer) -> Tuple[str, int, int]:
+    """Read format and size from the header only; raise ``ImageRejected`` if unusable."""
+    img = _open(image_bytes)
+    return img.format or "", img.width, img.height
+
+
+def _center_box(width: int, height: int) -> Tuple[float, float, float, float]:
+    # Resize(256) + CenterCrop(224) эквивалентно вырезке центрального квадрата
+    # со стороной 224/256 от меньшей стороны с последующим масштабом до 224.
+    side = min(width, height) * CROP_SIZE / RESIZE_SIZE
+    left = (width - side) / 2
+    top = (height - side) / 2
+    return left, top, left + side, top + side
+
+
+def decode(image_bytes: ImageBuffer) -> Image.Image:
+    """Decode to an RGB ``CROP_SIZE`` square, using JPEG DCT scaling when possible."""
+    img = _open(image_bytes)
+    # draft выбирает масштаб 1/2, 1/4 или 1/8 так, чтобы меньшая сторона
+    # осталась не меньше RESIZE_SIZE; для не-JPEG это no-op.
+    scale = RESIZE_SIZE / min(img.size)
+    img.draft("RGB", (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+    try:
+        if img.mode not in _RESIZABLE_MODES:
+            img = img.convert("RGB")
+        img = img.resize((CROP_SIZE, CROP_SIZE), Image.BILINEAR, box=_center_box(*img.size))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    except Exception as e:
+        raise ImageRejected(f"Ошибка при обработке изображения: {e}") from e
+    return img
+
+
+def tiled_size(width: int, height: int, grid: int) -> Tuple[int, int]:
+    """Size whose ``grid`` x ``grid`` crops of ``CROP_SIZE`` step by a whole number of pixels.
+
+    The shorter side becomes ``RESIZE_SIZE`` scaled up to fit the grid with
+    half-crop overlap; the longer side keeps the aspect ratio as closely as
+    integer strides allow.
+    """
+    if grid <= 1:
+        return CROP_SIZE, CROP_SIZE
+    short_stride = CROP_SIZE // 2
+    short = CROP_SIZE + (grid - 1) * short_stride
+    long = round(short * max(width, height) / min(width, height))
+    long_stride = max(short_stride, round((long - CROP_SIZE) / (grid - 1)))
+    long = CROP_SIZE + (grid - 1) * long_stride
+    return (long, short) if width >= height else (short, long)
+
+
+def decode_tiled(image_bytes: ImageBuffer, grid: int) -> Image.Image:
+    """Decode the whole frame (no center crop) at ``tiled_size`` for plate analysis."""
+    img = _open(image_bytes)
+    size = tiled_size(img.width, img.height, grid)
+    img.draft("RGB", size)
+    try:
+        if img.mode not in _RESIZABLE_MODES:
+            img = img.convert("RGB")
+        img = img.resize(size, Image.BILINEAR)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+    except Exception as e:
+        raise ImageRejected(f"Ошибка при обработке изображения: {e}") from e
+    return img
+
+
+def to_tensor(img: Image.Image, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Normalize an RGB image into ``out`` (C, H, W) in a single pass."""
+    if out is None:
+        out = torch.empty((3, img.height, img.width), dtype=torch.float32)
+    hwc = out.permute(1, 2, 0).numpy()  # HWC-представление того же буфера
+    np.multiply(np.asarray(img), _SCALE, out=hwc)
+    np.subtract(hwc, _SHIFT, out=hwc)
+    return out
+
+
+def preprocess(image_bytes: ImageBuffer, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    return to_tensor(decode(image_bytes), out=out)
@@ -0,0 +1,105 @@
+"""ImageNet class -> dish projection built from nutrition_db.json keywords."""
+
+import logging
+from typing import Optional, Sequence, Set, Tuple
+
+import torch
+
+from .nutrition import NutritionStore, NutritionTable, compound, forms, tokens
+
+
+logger = logging.getLogger("vision_service")
+
+# В ImageNet-1k классы 0..397 — животные; совпадения вроде «prairie chicken»
+# или «anemone fish» с ключевыми словами блюд там ложные.
+IMAGENET_ANIMAL_CLASSES = 398
+
+# Проверенные исключения: эти классы сопоставляются только целым названием,
+# отдельные слова дают ложные пары («milk can» -> каша рисовая,
+# «meat loaf» -> любое мясное блюдо, «mashed potato» -> картофель фри,
+# «plate rack» -> блюда на тарелке).
+WHOLE_NAME_ONLY_CLASSES = frozenset(compound(name) for name in ("milk can", "meat loaf", "mashed potato", "plate rack"))
+
+# Еда без пары в базе блюд и посуда/заведения (тарелка, миска, сковорода, ресторан...):
+# вместе с сопоставленными классами это признак того, что на фото вообще еда.
+IMAGENET_FOOD_CONTEXT_CLASSES = (
+    frozenset(range(923, 970)) - {958}
+) | {415, 467, 504, 521, 544, 567, 659, 738, 762, 809, 868, 909}
+
+
+def class_terms(category: str) -> Set[str]:
+    """Keys a class name matches: the whole name and, unless excluded, each of its words."""
+    name = compound(category)
+    terms = forms(name)
+    if name not in WHOLE_NAME_ONLY_CLASSES:
+        terms |= {form for word in tokens(category) for form in forms(word)}
+    return terms
+
+
+def build_matrix(table: NutritionTable, categories: Sequence[str]) -> torch.Tensor:
+    """Dense (len(categories), len(table)) matrix; each mapped row sums to 1.
+
+    A class matches a dish when one of the dish keywords equals the whole
+    class name ("ice cream" = "icecream") or, outside
+    ``WHOLE_NAME_ONLY_CLASSES``, one word of it. ImageNet animal classes are
+    never matched. The probability mass of a class that matches several
+    dishes is split evenly between them.
+    """
+    matrix = torch.zeros((len(categories), len(table)), dtype=torch.float32)
+    first_row = IMAGENET_ANIMAL_CLASSES if len(categories) == 1000 else 0
+    for row, category in enumerate(categories[first_row:], start=first_row):
+        cols = table.match(class_terms(category))
+        if len(cols):
+            matrix[row, torch.from_numpy(cols).long()] = 1.0
+    totals = matrix.sum(dim=1, keepdim=True)
+    return matrix / totals.clamp(min=1.0)
+
+
+class DishProjection:
+    def __init__(self, table: NutritionTable, categories: Sequence[str]):
+        self.table = table
+        self.dishes = table.dishes
+        self.matrix = build_matrix(table, categories)
+        mapped = self.matrix.sum(dim=1) > 0
+        self.mapped_classes = int(mapped.sum())
+        # Блюдо без единого класса-источника модель назвать не может.
+        self.uncovered: Tuple[str, ...] = tuple(
+            name for name, covered in zip(table.names, (self.matrix.sum(dim=0) > 0).tolist()) if not covered
+        )
+        if len(categories) == 1000:
+            mapped[list(IMAGENET_FOOD_CONTEXT_CLASSES)] = True
+        self.food_classes = mapped.to(torch.float32)
+
+    def scores(self, probs: torch.Tensor) -> torch.Tensor:
+        """(N, 1000) ImageNet probabilities -> (N, D) dish scores in one matmul."""
+        return probs @ self.matrix
+
+    def food_mass(self, probs: torch.Tensor) -> torch.Tensor:
+        """(N, 1000) ImageNet probabilities -> (N,) probability that the photo shows food at all."""
+        return probs @ self.food_classes
+
+
+class ProjectionSource:
+    """Keeps a ``DishProjection`` in sync with the shared nutrition table."""
+
+    def __init__(self, store: NutritionStore, categories: Sequence[str]):
+        self.store = store
+        self.categories = list(categories)
+        self._projection: Optional[DishProjection] = None
+        self.current()
+
+    def current(self) -> DishProjection:
+        table = self.store.current()
+        projection = self._projection
+        if projection is None or projection.table is not table:
+            # Таблица неизменяема, поэтому смена объекта и есть признак перезагрузки.
+            projection = DishProjection(table, self.categories)
+            self._projection = projection
+            logger.info(
+                "Проекция ImageNet -> блюда: %s блюд, %s классов сопоставлено",
+                len(table),
+                projection.mapped_classes,
+            )
+            if projection.uncovered:
+                logger.warning("Блюда без классов ImageNet: %s", ", ".join(projection.uncovered))
+        return projection
@@ -0,0 +1,84 @@
+"""INT8 post-training quantization of the EfficientNet-B0 classifier."""
+
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from .backends import ARTIFACT_TAG
+from .preprocessing import CROP_SIZE, ImageRejected, preprocess
+
+
+logger = logging.getLogger("vision_service")
+
+QUANTIZATION_MODES = ("none", "static")
+QUANTIZED_ENGINE = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+
+
+def quantize_static(model: torch.nn.Module, calibration: Iterable[torch.Tensor]) -> torch.nn.Module:
+    """FX graph-mode static PTQ: observers are calibrated on ``calibration`` batches."""
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    example = torch.zeros((1, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    prepared = prepare_fx(model.eval(), get_default_qconfig_mapping(QUANTIZED_ENGINE), example_inputs=(example,))
+    batches = 0
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+            batches += 1
+    if not batches:
+        raise ValueError("Нет изображений для калибровки")
+    return convert_fx(prepared)
+
+
+def static_artifact_path(cache_dir: str, digest: str) -> str:
+    return os.path.join(cache_dir, f"efficientnet_b0_{digest[:16]}.{ARTIFACT_TAG}.int8.torchscript.pt")
+
+
+def save_static_artifact(model: torch.nn.Module, path: str) -> torch.jit.ScriptModule:
+    example = torch.zeros((1, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(model, example))
+    tmp = path + ".tmp"
+    torch.jit.save(frozen, tmp)
+    os.replace(tmp, path)
+    return frozen
+
+
+def load_static_artifact(path: str) -> Optional[torch.jit.ScriptModule]:
+    if not os.path.exists(path):
+        logger.warning(f"Нет откалиброванной INT8-модели: {path}")
+        return None
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    try:
+        return torch.jit.load(path, map_location="cpu")
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить INT8-модель: {e}")
+        return None
+
+
+# --- Локальный набор изображений для калибровки и сравнения ---
+def list_images(directory: str, limit: Optional[int] = None) -> List[Path]:
+    paths = sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    return paths[:limit] if limit else paths
+
+
+def iter_batches(paths: Sequence[Path], batch_size: int) -> Iterator[torch.Tensor]:
+    batch = torch.empty((batch_size, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    filled = 0
+    for path in paths:
+        try:
+            preprocess(path.read_bytes(), out=batch[filled])
+        except (OSError, ImageRejected) as e:
+            logger.warning(f"Пропускаем {path}: {e}")
+            continue
+        filled += 1
+        if filled == batch_size:
+            yield batch.clone()
+            filled = 0
+    if filled:
+        yield batch[:filled].clone()
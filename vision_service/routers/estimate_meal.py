@@ -1,29 +1,303 @@
+import asyncio
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Awaitable, Optional
 
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 
-from ..service import NutritionService, estimate_meal
+from .. import config
+from ..batch import BatchItem, iter_multipart, multipart_boundary, stream_estimates
+from ..batching import MicroBatcher, QueueFull
+from ..cache import EstimateCache, content_key, file_key, plate_key
+from ..metrics import REQUEST_SECONDS, SHED_REQUESTS
+from ..phash import PerceptualIndex
+from ..preprocessing import ImageBuffer, ImageRejected, probe
+from ..service import NutritionService, estimate_meal_batched, estimate_plate
 
 
-def get_router(nutrition_service: NutritionService) -> APIRouter:
+def get_router(
+    nutrition_service: NutritionService,
+    batcher: MicroBatcher,
+    cache: EstimateCache,
+    phash_index: PerceptualIndex,
+) -> APIRouter:
     router = APIRouter(prefix="/vision", tags=["vision"])
     logger = logging.getLogger(__name__)
 
+    async def estimate(image_bytes: ImageBuffer, file_unique_id: Optional[str] = None) -> dict:
+        # Только заголовок: слишком большие и битые файлы отсекаем до декодирования.
+        probe(image_bytes)
+        keys = [content_key(image_bytes)]
+        if file_unique_id:
+            keys.append(file_key(file_unique_id))
+        return await cache.get_or_compute(
+            keys, lambda: estimate_meal_batched(image_bytes, nutrition_service, batcher, phash_index)
+        )
+
+    async def estimate_patiently(image_bytes: bytes) -> dict:
+        # Пакетная загрузка — фоновая работа: при полной очереди ждём, а не отказываем.
+        while True:
+            try:
+                return await estimate(image_bytes)
+            except QueueFull as e:
+                await asyncio.sleep(e.retry_after)
+
+    def admit() -> None:
+        # Очередь полна: отказываем сразу, не тратя CPU на чтение и хеширование.
+        if batcher.full:
+            raise _overloaded(batcher.retry_after())
+
     @router.post("/estimate_meal")
-    async def estimate_meal_endpoint(image: UploadFile = File(...)):
+    async def estimate_meal_endpoint(
+        request: Request,
+        image: UploadFile = File(...),
+        file_unique_id: Optional[str] = Form(None),
+    ):
+        started = time.perf_counter()
+        admit()
         if not image.content_type or not image.content_type.startswith("image/"):
             raise HTTPException(status_code=400, detail="Файл должен быть изображением")
         await image.seek(0)
         image_bytes = await image.read()
         if not image_bytes:
             raise HTTPException(status_code=400, detail="Файл изображения пустой")
-        result = estimate_meal(image_bytes, nutrition_service)
+        try:
+            result = await _with_deadline(request, estimate(image_bytes, file_unique_id))
+        except ImageRejected as e:
+            raise HTTPException(status_code=413 if e.too_large else 400, detail=str(e))
+        except QueueFull as e:
+            raise _overloaded(e.retry_after)
         logger.info(
             "Vision estimate: size=%sB label=%s calories=%s",
             len(image_bytes),
             result.get("label"),
             result.get("calories_kcal"),
         )
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "estimate_meal")
         return result
 
+    @router.post("/estimate_meal/raw")
+    async def estimate_meal_raw_endpoint(request: Request, file_unique_id: Optional[str] = None):
+        """Same as ``/estimate_meal``, but the body is the image itself (``application/octet-stream``).
+
+        The body is streamed into one buffer sized from Content-Length and
+        decoded through a memoryview, without multipart parsing, temp files or
+        intermediate ``bytes`` copies.
+        """
+        started = time.perf_counter()
+        admit()
+        content_type = request.headers.get("content-type", "")
+        if not (content_type.startswith("application/octet-stream") or content_type.startswith("image/")):
+            raise HTTPException(status_code=415, detail="Ожидается application/octet-stream или image/*")
+        image = await _read_body(request)
+        if not image:
+            raise HTTPException(status_code=400, detail="Файл изображения пустой")
+        if isinstance(batcher.executor, ProcessPoolExecutor):
+            # В пул процессов memoryview не передать: всё равно будет сериализация.
+            image = bytes(image)
+        try:
+            result = await _with_deadline(request, estimate(image, file_unique_id))
+        except ImageRejected as e:
+            raise HTTPException(status_code=413 if e.too_large else 400, detail=str(e))
+        except QueueFull as e:
+            raise _overloaded(e.retry_after)
+        logger.info(
+            "Vision estimate (raw): size=%sB label=%s calories=%s",
+            len(image),
+            result.get("label"),
+            result.get("calories_kcal"),
+        )
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "estimate_meal_raw")
+        return result
+
+    @router.post("/estimate_plate")
+    async def estimate_plate_endpoint(request: Request, image: UploadFile = File(...)):
+        """Several dishes on one photo: per-item labels, boxes and summed macros."""
+        started = time.perf_counter()
+        admit()
+        if not image.content_type or not image.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="Файл должен быть изображением")
+        image_bytes = await image.read()
+        if not image_bytes:
+            raise HTTPException(status_code=400, detail="Файл изображения пустой")
+        try:
+            probe(image_bytes)
+            result = await _with_deadline(
+                request,
+                cache.get_or_compute(
+                    [plate_key(image_bytes)], lambda: estimate_plate(image_bytes, nutrition_service, batcher)
+                ),
+            )
+        except ImageRejected as e:
+            raise HTTPException(status_code=413 if e.too_large else 400, detail=str(e))
+        except QueueFull as e:
+            raise _overloaded(e.retry_after)
+        logger.info(
+            "Vision plate estimate: size=%sB items=%s calories=%s",
+            len(image_bytes),
+            len(result["items"]),
+            result.get("calories_kcal"),
+        )
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "estimate_plate")
+        return result
+
+    @router.post("/estimate_meal/batch")
+    async def estimate_meal_batch_endpoint(request: Request):
+        """Many images as repeated ``images`` parts or one zip/tar ``archive`` part.
+
+        Responds with NDJSON, one line per image in completion order:
+        ``{"index", "filename", "result"}`` or ``{"index", "filename", "error"}``.
+        """
+        try:
+            boundary = multipart_boundary(request.headers.get("content-type", ""))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        body_read = asyncio.Event()
+
+        async def chunks() -> AsyncIterator[bytes]:
+            async for chunk in request.stream():
+                yield chunk
+            body_read.set()
+
+        # Форму разбираем по мере чтения тела: новые части читаются, только когда
+        # освобождается слот оценки, так что в памяти не больше BATCH_MAX_INFLIGHT файлов.
+        parts = iter_multipart(chunks(), boundary, config.MAX_IMAGE_BYTES, config.BATCH_MAX_FILES)
+        try:
+            first = await parts.__anext__()
+        except StopAsyncIteration:
+            raise HTTPException(status_code=400, detail="Нужны части images или архив archive")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except ClientDisconnect:
+            raise HTTPException(status_code=499, detail="Клиент отключился")
+
+        async def items() -> AsyncIterator[BatchItem]:
+            yield first
+            async for item in parts:
+                yield item
+
+        async def body() -> AsyncIterator[bytes]:
+            disconnect: Optional[asyncio.Future] = None
+            lines = stream_estimates(items(), estimate_patiently, config.BATCH_MAX_INFLIGHT)
+            try:
+                async for line in lines:
+                    yield line
+                    if disconnect is None and body_read.is_set():
+                        disconnect = asyncio.ensure_future(_wait_disconnect(request))
+                    if disconnect is not None and disconnect.done():
+                        SHED_REQUESTS.inc("disconnected")
+                        break
+            except ClientDisconnect:
+                SHED_REQUESTS.inc("disconnected")
+            finally:
+                await lines.aclose()
+                await parts.aclose()
+                if disconnect is not None:
+                    disconnect.cancel()
+
+        return _UploadStreamingResponse(body(), media_type="application/x-ndjson")
+
+    @router.get("/estimate_meal/cached")
+    async def cached_estimate_endpoint(file_unique_id: str):
+        # Предпроверка перед загрузкой: промах засчитает следующий за ней POST, иначе он учитывался бы дважды.
+        result = cache.get(file_key(file_unique_id), count_miss=False)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Оценка не найдена в кэше")
+        return result
+
+    @router.get("/cache/stats")
+    async def cache_stats_endpoint():
+        return {**cache.stats(), "near_duplicates": phash_index.stats()}
+
     return router
+
+
+def _overloaded(retry_after: int) -> HTTPException:
+    SHED_REQUESTS.inc("queue_full")
+    return HTTPException(
+        status_code=429, detail="Сервис перегружен, повторите позже", headers={"Retry-After": str(retry_after)}
+    )
+
+
+async def _read_body(request: Request) -> memoryview:
+    limit = config.MAX_IMAGE_BYTES
+    too_large = HTTPException(status_code=413, detail="Файл слишком большой")
+    try:
+        expected = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        expected = 0
+    if expected > limit:
+        raise too_large
+    # Буфер выделяется один раз по Content-Length; растёт, только если длина не указана.
+    buffer = bytearray(expected or 64 * 1024)
+    filled = 0
+    async for chunk in request.stream():
+        end = filled + len(chunk)
+        if end > limit:
+            raise too_large
+        if end > len(buffer):
+            buffer.extend(bytes(max(end - len(buffer), len(buffer))))
+        buffer[filled:end] = chunk
+        filled = end
+    return memoryview(buffer)[:filled]
+
+
+def _timeout_seconds(request: Request) -> float:
+    # Клиент передаёт свой оставшийся бюджет; больше серверного лимита не ждём.
+    timeout_ms = config.REQUEST_TIMEOUT_MS
+    header = request.headers.get("x-request-timeout-ms")
+    if header:
+        try:
+            timeout_ms = min(timeout_ms, max(0, int(header)))
+        except ValueError:
+            pass
+    return timeout_ms / 1000
+
+
+async def _wait_disconnect(request: Request) -> None:
+    # Тело уже прочитано, поэтому следующее сообщение ASGI — только http.disconnect.
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _with_deadline(request: Request, work: Awaitable[dict]) -> dict:
+    """Await ``work`` until the client's deadline or disconnect, cancelling it otherwise.
+
+    Cancelling the cache waiter drops the queued image before the model runs
+    unless another client is still waiting for the same estimate.
+    """
+    work_task = asyncio.ensure_future(work)
+    disconnect = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {work_task, disconnect}, timeout=_timeout_seconds(request), return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        disconnect.cancel()
+    if work_task in done:
+        return work_task.result()
+    work_task.cancel()
+    if disconnect in done:
+        SHED_REQUESTS.inc("disconnected")
+        # Ответ уже некому отправить; 499 — статус nginx для ушедшего клиента.
+        raise HTTPException(status_code=499, detail="Клиент отключился")
+    SHED_REQUESTS.inc("deadline")
+    raise HTTPException(status_code=504, detail="Истёк срок ожидания запроса")
+
+
+class _UploadStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator is still reading the request.
+
+    The stock response listens for ``http.disconnect`` alongside the body and
+    would swallow the upload's ``http.request`` messages; here the generator
+    reads the body itself and watches for the disconnect once it is done.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
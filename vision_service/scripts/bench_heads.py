@@ -0,0 +1,72 @@
+"""Per-request cost of dish + portion heads versus dish classification alone.
+
+Usage: python -m vision_service.scripts.bench_heads [--batch-sizes 1 8] [--repeats 20]
+
+Both runs go through ``classify_batch`` (decode, one backend forward, heads).
+Without VISION_PORTION_HEAD a random head of the right shape is used: the
+cost does not depend on the weights.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from .. import config
+from ..backends import EMBEDDING_DIM
+from ..heads import PortionHead
+from ..inference import _load_model, classify_batch
+from .check_backends import synthetic_jpegs
+
+
+def _time_ms(images: List[bytes], batch_size: int, repeats: int) -> float:
+    batch = images[:batch_size]
+    classify_batch(batch)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        classify_batch(batch)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000
+
+
+def _run(head_path: str, images: List[bytes], batch_sizes: List[int], repeats: int) -> Dict[int, float]:
+    config.PORTION_HEAD = head_path
+    _load_model.cache_clear()
+    return {size: _time_ms(images, size, repeats) for size in batch_sizes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    images = synthetic_jpegs(max(args.batch_sizes), args.seed)
+    head_path = config.PORTION_HEAD
+    with tempfile.TemporaryDirectory() as tmp:
+        if not head_path:
+            rng = np.random.default_rng(args.seed)
+            head_path = os.path.join(tmp, "portion_head.npz")
+            PortionHead(rng.normal(0, 1e-3, EMBEDDING_DIM), np.log(200)).save(head_path)
+        dish_only = _run("", images, args.batch_sizes, args.repeats)
+        with_portion = _run(head_path, images, args.batch_sizes, args.repeats)
+
+    report = []
+    for size in args.batch_sizes:
+        report.append({
+            "batch_size": size,
+            "dish_only_ms_per_image": round(dish_only[size] / size, 2),
+            "dish_and_portion_ms_per_image": round(with_portion[size] / size, 2),
+            "overhead_pct": round((with_portion[size] / dish_only[size] - 1) * 100, 2),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark kNN query latency against reference set size.
+
+Usage: python -m vision_service.scripts.bench_knn [--sizes 10000 100000 ...] [--batch 8]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ..knn import EmbeddingIndex, normalize
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 100_000, 300_000])
+    parser.add_argument("--dim", type=int, default=1280)
+    parser.add_argument("--batch", type=int, default=8, help="запросов в одном поиске")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--chunk-rows", type=int, default=16384)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'size':>10} {'ms/search':>10} {'ms/query':>10} {'index MB':>10}")
+    for size in args.sizes:
+        vectors = normalize(rng.standard_normal((size, args.dim), dtype=np.float32))
+        labels = rng.integers(0, 50, size=size, dtype=np.int32)
+        index = EmbeddingIndex(vectors, labels, [str(i) for i in range(50)], chunk_rows=args.chunk_rows)
+        queries = rng.standard_normal((args.batch, args.dim), dtype=np.float32)
+        index.search(queries, args.k)
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            index.search(queries, args.k)
+        per_search = (time.perf_counter() - started) / args.repeats * 1000
+        print(f"{size:>10} {per_search:>10.2f} {per_search / args.batch:>10.2f} {vectors.nbytes / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Benchmark near-duplicate lookup cost against perceptual index size.
+
+Usage: python -m vision_service.scripts.bench_phash [--sizes 1000 10000 ...]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from ..phash import PerceptualIndex
+
+
+def bench(size: int, lookups: int, rng: np.random.Generator) -> float:
+    index = PerceptualIndex(capacity=size)
+    hashes = rng.integers(0, 2**63, size=size, dtype=np.int64).astype(np.uint64)
+    for value in hashes.tolist():
+        index.add(value, {})
+    queries = rng.integers(0, 2**63, size=lookups, dtype=np.int64).tolist()
+    started = time.perf_counter()
+    for value in queries:
+        index.lookup(value)
+    return (time.perf_counter() - started) / lookups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 4_096, 16_384, 65_536, 262_144])
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'size':>10} {'us/lookup':>12} {'index bytes':>12}")
+    for size in args.sizes:
+        per_lookup = bench(size, args.lookups, rng)
+        print(f"{size:>10} {per_lookup * 1e6:>12.1f} {size * 8:>12}")
+
+
+if __name__ == "__main__":
+    main()
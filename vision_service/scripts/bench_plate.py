@@ -0,0 +1,50 @@
+"""Plate analysis latency against one batched forward and per-crop calls.
+
+Usage: python -m vision_service.scripts.bench_plate [--grid 3] [--repeats 10]
+"""
+
+import argparse
+import json
+import time
+from typing import Callable
+
+import numpy as np
+import torch
+
+from ..inference import _load_model, classify, classify_plate
+from ..preprocessing import CROP_SIZE
+from .check_backends import synthetic_jpegs
+
+
+def _median_ms(fn: Callable[[], object], repeats: int) -> float:
+    fn()
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return round(float(np.median(timings)) * 1000, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    image = synthetic_jpegs(1, args.seed)[0]
+    crops = args.grid * args.grid
+    backend = _load_model().backend
+    batch = torch.zeros((crops, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    report = {
+        "crops": crops,
+        "forward_only_ms": _median_ms(lambda: backend(batch), args.repeats),
+        "plate_analysis_ms": _median_ms(lambda: classify_plate(image, args.grid), args.repeats),
+        "separate_calls_ms": _median_ms(lambda: [classify(image) for _ in range(crops)], args.repeats),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Memory and throughput of the multi-process server against the number of workers.
+
+Usage:
+  python -m vision_service.scripts.bench_workers [--workers 1 2 4] [--requests 200] [--concurrency 16]
+      [--out report.json]
+
+Every worker count is run twice, with private and with shared (memory-mapped)
+weights. Each run starts ``python -m vision_service.serve`` on a loopback
+port, waits for /ready, drives it with synthetic Telegram-sized JPEGs and
+then reads RSS and PSS of the whole process tree from /proc. PSS splits
+shared pages between the processes that map them, so its total is the
+memory the server actually costs. Uses the weights from the local model cache.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+from .check_backends import synthetic_jpegs
+from .loadtest import TELEGRAM_JPEG_QUALITY, TELEGRAM_SIZES
+
+
+def _tree(pid: int) -> List[int]:
+    pids = [pid]
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{tid}/children") as f:
+            for child in f.read().split():
+                pids.extend(_tree(int(child)))
+    return pids
+
+
+def _memory_mb(pid: int) -> Dict[str, float]:
+    values = {"rss": 0.0, "pss": 0.0}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower()] = int(rest.split()[0]) / 1024
+    return values
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise SystemExit("Сервер не стал готов вовремя")
+
+
+async def _drive(base_url: str, images: List[bytes], requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    counter = 0
+
+    async def worker(client: httpx.AsyncClient, count: int) -> None:
+        nonlocal counter
+        for _ in range(count):
+            counter += 1
+            # Уникальный хвост после конца JPEG, чтобы не срабатывал кэш оценок.
+            body = images[counter % len(images)] + counter.to_bytes(8, "little")
+            started = time.perf_counter()
+            response = await client.post("/vision/estimate_meal", files={"image": ("photo.jpg", body, "image/jpeg")})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, n) for n in per_worker))
+        elapsed = time.perf_counter() - started
+    return {
+        "errors": requests - len(latencies),
+        "images_per_sec": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2) if latencies else 0.0,
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def _run(workers: int, shared: bool, args, images: List[bytes]) -> Dict[str, object]:
+    env = {
+        **os.environ,
+        "VISION_SERVER_WORKERS": str(workers),
+        "VISION_SHARED_WEIGHTS": "1" if shared else "0",
+        "VISION_PHASH_INDEX_SIZE": "0",
+        "VISION_QUEUE_MAX": "0",
+    }
+    base_url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "vision_service.serve", "--host", "127.0.0.1", "--port", str(args.port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(base_url, process, args.startup_timeout)
+        asyncio.run(_drive(base_url, images, args.warmup, args.concurrency))
+        result = asyncio.run(_drive(base_url, images, args.requests, args.concurrency))
+        # Память — после нагрузки: в ней уже есть буферы активаций всех воркеров.
+        memory = [_memory_mb(pid) for pid in _tree(process.pid)]
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        "workers": workers,
+        "shared_weights": shared,
+        "processes": len(memory),
+        "rss_mb": round(sum(m["rss"] for m in memory), 1),
+        "pss_mb": round(sum(m["pss"] for m in memory), 1),
+        "pss_mb_per_worker": round(sum(m["pss"] for m in memory) / workers, 1),
+        **result,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="показывать логи сервера")
+    parser.add_argument("--out", help="файл отчёта; по умолчанию stdout")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    images = synthetic_jpegs(24, args.seed, sizes=TELEGRAM_SIZES, quality=TELEGRAM_JPEG_QUALITY)
+    results = []
+    for workers in args.workers:
+        for shared in (False, True):
+            results.append(_run(workers, shared, args, images))
+            print(json.dumps(results[-1]), file=sys.stderr, flush=True)
+
+    report = {"meta": {"cpu_count": os.cpu_count(), "seed": args.seed}, "results": results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Build (or extend) the kNN reference index from photos grouped by dish.
+
+Layout: REFERENCES/<название блюда>/*.jpg — the folder name must match "name"
+in nutrition_db.json so that calories can be looked up.
+
+Usage: python -m vision_service.scripts.build_knn_index --references DIR --out DIR [--append]
+"""
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+
+from ..inference import _load_model, logger
+from ..knn import EmbeddingIndex, build_index
+from ..quantization import iter_batches, list_images
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--references", required=True)
+    parser.add_argument("--out", required=True, help="каталог индекса (VISION_KNN_INDEX)")
+    parser.add_argument("--append", action="store_true", help="дополнить существующий индекс")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    backend = _load_model().backend
+    embeddings = []
+    names = []
+    for dish_dir in sorted(p for p in Path(args.references).iterdir() if p.is_dir()):
+        count = 0
+        for batch in iter_batches(list_images(str(dish_dir)), args.batch_size):
+            batch_embeddings, _ = backend(batch)
+            embeddings.append(batch_embeddings.numpy())
+            count += len(batch)
+        names.extend([dish_dir.name] * count)
+        logger.info("%s: %s эталонов", dish_dir.name, count)
+    if not names:
+        raise SystemExit(f"В {args.references} нет изображений")
+
+    base = None
+    if args.append and os.path.exists(args.out):
+        base = EmbeddingIndex.load(args.out, mmap=True)
+    index = build_index(np.concatenate(embeddings), names, base=base)
+    index.save(args.out)
+    logger.info("kNN-индекс сохранён: %s эталонов, %s блюд, %s", len(index), len(index.dishes), args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Calibrate and save the static INT8 model used by VISION_QUANTIZATION=static.
+
+Usage: python -m vision_service.scripts.calibrate_quant --images DIR [--limit 256]
+"""
+
+import argparse
+
+from ..inference import MODEL_CACHE_DIR, _verify_or_download_weights, build_eager_model, logger
+from ..quantization import iter_batches, list_images, quantize_static, save_static_artifact, static_artifact_path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", required=True, help="каталог с типичными фото блюд")
+    parser.add_argument("--limit", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        raise SystemExit(f"В {args.images} нет изображений")
+
+    digest = _verify_or_download_weights()
+    model = build_eager_model()
+    quantized = quantize_static(model, iter_batches(paths, args.batch_size))
+    path = static_artifact_path(MODEL_CACHE_DIR, digest)
+    save_static_artifact(quantized, path)
+    logger.info("INT8-модель откалибрована на %s изображениях: %s", len(paths), path)
+
+
+if __name__ == "__main__":
+    main()
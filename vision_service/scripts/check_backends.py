@@ -0,0 +1,110 @@
+"""Golden-output check and latency comparison for all inference backends.
+
+Usage:
+  python -m vision_service.scripts.check_backends [--backends eager torchscript onnx]
+  python -m vision_service.scripts.check_backends --save-golden golden.pt
+  python -m vision_service.scripts.check_backends --golden golden.pt
+
+Exits with status 1 if any backend disagrees with the golden outputs.
+"""
+
+import argparse
+import json
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .. import config
+from ..backends import BACKENDS, EagerBackend, InferenceBackend
+from ..inference import _load_backend, _verify_or_download_weights, build_eager_model
+from ..preprocessing import CROP_SIZE, preprocess
+
+
+def synthetic_jpegs(
+    count: int, seed: int, sizes: Optional[Sequence[Tuple[int, int]]] = None, quality: int = 85
+) -> List[bytes]:
+    # Детерминированные «фото»: гладкие градиенты с шумом, пережатые в JPEG,
+    # чтобы вход проходил тот же путь декодирования, что и в сервисе.
+    rng = np.random.default_rng(seed)
+    images = []
+    for i in range(count):
+        if sizes:
+            w, h = sizes[i % len(sizes)]
+        else:
+            h, w = rng.integers(480, 1280, size=2)
+        base = np.linspace(0, 255, w, dtype=np.float32)[None, :, None] * rng.random(3, dtype=np.float32)
+        noise = rng.normal(0, 25, size=(h, w, 3)).astype(np.float32)
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, "JPEG", quality=quality)
+        images.append(buffer.getvalue())
+    return images
+
+
+def golden_inputs(count: int, seed: int) -> torch.Tensor:
+    batch = torch.empty((count, 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+    for i, image_bytes in enumerate(synthetic_jpegs(count, seed)):
+        preprocess(image_bytes, out=batch[i])
+    return batch
+
+
+def latency_ms(backend: InferenceBackend, batch: torch.Tensor, repeats: int) -> float:
+    backend(batch)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        backend(batch)
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--atol", type=float, default=1e-4, help="допуск по вероятностям softmax")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--golden", help="сверять с сохранёнными эталонными вероятностями")
+    parser.add_argument("--save-golden", help="сохранить эталон, посчитанный eager-моделью")
+    args = parser.parse_args()
+
+    _verify_or_download_weights()
+    batch = golden_inputs(args.images, args.seed)
+    if args.golden:
+        golden = torch.load(args.golden)
+    else:
+        with torch.inference_mode():
+            golden = EagerBackend(build_eager_model())(batch)[1].softmax(dim=-1)
+    if args.save_golden:
+        torch.save(golden, args.save_golden)
+
+    # Квантованные модели сравниваются отдельно (compare_quant), здесь — fp32.
+    config.QUANTIZATION = "none"
+    digest = _verify_or_download_weights()
+    report: Dict[str, Dict[str, object]] = {}
+    failed = False
+    for name in args.backends:
+        config.BACKEND = name
+        backend = _load_backend(digest)
+        probs = backend(batch)[1].softmax(dim=-1)
+        max_diff = (probs - golden).abs().max().item()
+        top1_match = bool((probs.argmax(dim=-1) == golden.argmax(dim=-1)).all())
+        ok = backend.name == name and max_diff <= args.atol and top1_match
+        failed |= not ok
+        report[name] = {
+            "ok": ok,
+            "loaded_as": backend.name,
+            "max_abs_diff": max_diff,
+            "top1_match": top1_match,
+            "batch_latency_ms": round(latency_ms(backend, batch, args.repeats), 2),
+        }
+    print(json.dumps({"images": args.images, "threads": torch.get_num_threads(), "backends": report}, indent=2))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Coverage check of the ImageNet-to-dish projection: every dish needs at least one source class.
+
+Usage: python -m vision_service.scripts.check_projection [--db nutrition_db.json]
+
+Prints, for each dish, the ImageNet classes projected onto it with the share
+of each class it receives. Exits with status 1 if some dish has none, since
+the model could never name it.
+"""
+
+import argparse
+import json
+
+from torchvision.models import EfficientNet_B0_Weights
+
+from ..nutrition import DB_FILE, NutritionStore
+from ..projection import DishProjection
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DB_FILE, help="файл базы блюд")
+    args = parser.parse_args()
+
+    categories = EfficientNet_B0_Weights.IMAGENET1K_V1.meta["categories"]
+    table = NutritionStore(args.db).current()
+    if not len(table):
+        raise SystemExit(f"Не удалось загрузить {args.db}")
+    projection = DishProjection(table, categories)
+    sources = {
+        name: {categories[row]: round(float(projection.matrix[row, col]), 3) for row in projection.matrix[:, col].nonzero().flatten().tolist()}
+        for col, name in enumerate(table.names)
+    }
+    print(json.dumps({
+        "dishes": len(table),
+        "mapped_classes": projection.mapped_classes,
+        "uncovered": list(projection.uncovered),
+        "sources": sources,
+    }, indent=2, ensure_ascii=False))
+    if projection.uncovered:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
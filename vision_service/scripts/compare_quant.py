@@ -0,0 +1,82 @@
+"""Compare the calibrated INT8 model against fp32: top-1/top-k agreement, latency, throughput.
+
+Usage: python -m vision_service.scripts.compare_quant --images DIR
+Prints a JSON report.
+"""
+
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import torch
+
+from ..inference import MODEL_CACHE_DIR, _verify_or_download_weights, build_eager_model
+from ..quantization import iter_batches, list_images, load_static_artifact, static_artifact_path
+
+
+def _run(model: torch.nn.Module, batches: List[torch.Tensor], topk: int) -> Dict[str, object]:
+    latencies = []
+    indices = []
+    with torch.no_grad():
+        model(batches[0])  # прогрев
+        for batch in batches:
+            started = time.perf_counter()
+            _, logits = model(batch)
+            latencies.append(time.perf_counter() - started)
+            indices.append(torch.topk(logits, k=topk, dim=-1).indices)
+    images = sum(len(b) for b in batches)
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "indices": torch.cat(indices),
+        "images_per_sec": round(images / total, 2),
+        "batch_latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 2),
+        "batch_latency_ms_max": round(latencies[-1] * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--limit", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--topk", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op потоки, 0 — по умолчанию")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    paths = list_images(args.images, args.limit)
+    batches = list(iter_batches(paths, args.batch_size))
+    if not batches:
+        raise SystemExit(f"В {args.images} нет изображений")
+
+    digest = _verify_or_download_weights()
+    fp32 = build_eager_model()
+    quantized = load_static_artifact(static_artifact_path(MODEL_CACHE_DIR, digest))
+    if quantized is None:
+        raise SystemExit("Сначала запустите python -m vision_service.scripts.calibrate_quant")
+
+    reference = _run(fp32, batches, args.topk)
+    candidate = _run(quantized, batches, args.topk)
+    ref_idx, q_idx = reference.pop("indices"), candidate.pop("indices")
+    top1 = (ref_idx[:, 0] == q_idx[:, 0]).float().mean().item()
+    # fp32 top-1 попадает в top-k квантованной модели
+    topk = (q_idx == ref_idx[:, :1]).any(dim=1).float().mean().item()
+
+    report = {
+        "images": int(ref_idx.shape[0]),
+        "batch_size": args.batch_size,
+        "threads": torch.get_num_threads(),
+        "top1_agreement": round(top1, 4),
+        f"top{args.topk}_agreement": round(topk, 4),
+        "fp32": reference,
+        "int8": candidate,
+        "speedup": round(candidate["images_per_sec"] / reference["images_per_sec"], 3),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
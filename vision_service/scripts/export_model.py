@@ -0,0 +1,18 @@
+"""Download, verify and pre-build the optimized model artifact.
+
+Run at image build time so that a fresh replica only has to load it:
+python -m vision_service.scripts.export_model
+"""
+
+from ..inference import logger, warmup
+
+
+def main() -> None:
+    info = warmup(iterations=1)
+    if not info["weights_loaded"]:
+        raise SystemExit("Не удалось загрузить веса модели")
+    logger.info("Модель готова: %s", info)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Offline load test of the vision service: throughput and latency percentiles as JSON.
+
+Usage:
+  python -m vision_service.scripts.loadtest [--weights random|local] [--backends eager torchscript]
+      [--batch-sizes 1 8] [--concurrency 1 8 32] [--threads 1 4] [--requests 200] [--out report.json]
+
+The service runs in-process (ASGI transport, no sockets) on synthetic JPEGs at
+Telegram photo resolutions. ``--weights random`` initializes EfficientNet with
+a fixed seed in a temporary cache directory, so nothing is downloaded and the
+numbers are comparable between commits; ``local`` uses the verified weights
+already in the model cache. Every request of the whole run carries unique
+bytes, and the estimate cache and near-duplicate index are off, so each
+one reaches the model whatever the order of configurations.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import count
+from typing import Dict, Iterator, List
+
+import numpy as np
+import torch
+from torchvision import models
+
+from .. import config, inference
+from .check_backends import synthetic_jpegs
+
+
+# Самые большие PhotoSize, которые Telegram отдаёт боту для фото с телефона.
+TELEGRAM_SIZES = [(1280, 960), (960, 1280), (1280, 720), (720, 1280), (1280, 1280), (800, 600)]
+TELEGRAM_JPEG_QUALITY = 87
+
+
+def _use_random_weights(directory: str, seed: int) -> None:
+    torch.manual_seed(seed)
+    inference.MODEL_CACHE_DIR = directory
+    inference.MODEL_FILE = os.path.join(directory, "efficientnet_b0_random.pth")
+    torch.save(models.efficientnet_b0(weights=None).state_dict(), inference.MODEL_FILE)
+    # Проверка весов сверяет префикс SHA-256: подставляем хеш случайных весов.
+    inference.MODEL_HASH = inference._sha256(inference.MODEL_FILE)[:8]
+
+
+def _percentile_ms(latencies: List[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000, 2) if latencies else 0.0
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+async def _run_config(
+    images: List[bytes], counter: Iterator[int], concurrency: int, requests: int, warmup: int
+) -> Dict[str, object]:
+    import httpx
+
+    from .. import app as app_module
+
+    app = app_module.app
+    latencies: List[float] = []
+    errors = 0
+
+    def next_body() -> bytes:
+        # Байты после маркера конца JPEG декодер игнорирует, а SHA-256 меняется: кэш не срабатывает.
+        # Счётчик общий на весь прогон, иначе тела повторяются между конфигурациями.
+        n = next(counter)
+        return images[n % len(images)] + n.to_bytes(8, "little")
+
+    async def worker(client, count: int, record: bool) -> None:
+        nonlocal errors
+        for _ in range(count):
+            files = {"image": ("photo.jpg", next_body(), "image/jpeg")}
+            started = time.perf_counter()
+            response = await client.post("/vision/estimate_meal", files=files)
+            if response.status_code != 200:
+                errors += 1
+            elif record:
+                latencies.append(time.perf_counter() - started)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            await asyncio.gather(*(worker(client, max(1, warmup // concurrency), False) for _ in range(concurrency)))
+            per_worker = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(client, n, True) for n in per_worker))
+            elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "images_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": _percentile_ms(latencies, 50),
+        "p95_ms": _percentile_ms(latencies, 95),
+        "p99_ms": _percentile_ms(latencies, 99),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weights", choices=("random", "local"), default="random")
+    parser.add_argument("--backends", nargs="+", default=["torchscript"])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, nargs="+", default=[torch.get_num_threads()])
+    parser.add_argument("--requests", type=int, default=200, help="запросов на одну конфигурацию")
+    parser.add_argument("--warmup", type=int, default=16)
+    parser.add_argument("--images", type=int, default=24, help="число разных синтетических JPEG")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="файл отчёта; по умолчанию stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.weights == "random":
+            _use_random_weights(tmp, args.seed)
+        elif not os.path.exists(inference.MODEL_FILE):
+            raise SystemExit(f"Нет локальных весов: {inference.MODEL_FILE}")
+
+        from .. import app as app_module
+
+        # Каждый запрос должен дойти до модели, а очередь не должна отказывать.
+        app_module.estimate_cache.max_entries = 0
+        app_module.phash_index.capacity = 0
+        app_module.batcher.max_queue = 0
+        images = synthetic_jpegs(args.images, args.seed, sizes=TELEGRAM_SIZES, quality=TELEGRAM_JPEG_QUALITY)
+        counter = count(1)
+
+        results = []
+        for backend in args.backends:
+            for threads in args.threads:
+                config.BACKEND = backend
+                torch.set_num_threads(threads)
+                inference._load_model.cache_clear()
+                for batch_size in args.batch_sizes:
+                    app_module.batcher.max_batch_size = batch_size
+                    for concurrency in args.concurrency:
+                        result = asyncio.run(_run_config(images, counter, concurrency, args.requests, args.warmup))
+                        results.append({
+                            "backend": backend,
+                            "threads": threads,
+                            "batch_size": batch_size,
+                            "concurrency": concurrency,
+                            **result,
+                        })
+                        print(json.dumps(results[-1]), file=sys.stderr, flush=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "weights": args.weights,
+            "seed": args.seed,
+            "executor": config.EXECUTOR_MODE,
+            "workers": config.EXECUTOR_WORKERS,
+            "quantization": config.QUANTIZATION,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "image_sizes": TELEGRAM_SIZES,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
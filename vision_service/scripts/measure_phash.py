@@ -0,0 +1,102 @@
+"""False-match rate and duplicate recall of the near-duplicate index per Hamming distance.
+
+Usage:
+  python -m vision_service.scripts.measure_phash --images DIR [--crops 4] [--max-distance 16]
+
+Every photo in DIR (jpg/png/webp, recursively) is cut into ``--crops``
+overlapping views to get more hashes. For each distance the report gives
+the share of pairs of views from different photos that would be served
+each other's estimate (false matches), the share of views that match at
+least one view of another photo, and the share of re-encoded copies
+(downscaled to 60%, JPEG quality 70, as Telegram forwards do) found
+again (recall). Photos whose hash is rejected as degenerate are counted
+separately; they never enter the index.
+"""
+
+import argparse
+import json
+import os
+from io import BytesIO
+from typing import List
+
+import numpy as np
+from PIL import Image
+
+from ..phash import dhash, hamming_distances
+
+
+def _load(directory: str) -> List[Image.Image]:
+    images = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+                images.append(Image.open(os.path.join(root, name)).convert("RGB"))
+    return images
+
+
+def _crops(image: Image.Image, count: int) -> List[Image.Image]:
+    # Окна в 70% кадра со сдвигом по диагонали: разные, но похожие по композиции снимки.
+    w, h = image.size
+    cw, ch = int(w * 0.7), int(h * 0.7)
+    steps = max(1, count - 1)
+    return [image.crop((i * (w - cw) // steps, i * (h - ch) // steps, i * (w - cw) // steps + cw, i * (h - ch) // steps + ch)) for i in range(count)]
+
+
+def _jpeg(image: Image.Image, quality: int, scale: float = 1.0) -> bytes:
+    if scale != 1.0:
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR)
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", required=True, help="каталог с фото")
+    parser.add_argument("--crops", type=int, default=4, help="различных кадров из одного фото")
+    parser.add_argument("--max-distance", type=int, default=16)
+    args = parser.parse_args()
+
+    images = _load(args.images)
+    if len(images) < 2:
+        raise SystemExit("Нужно хотя бы два изображения")
+    originals, sources, copies, rejected = [], [], [], 0
+    for source, image in enumerate(images):
+        for view in _crops(image, args.crops):
+            original = dhash(_jpeg(view, 90))
+            if original is None:
+                rejected += 1
+                continue
+            originals.append(original)
+            sources.append(source)
+            copies.append(dhash(_jpeg(view, 70, scale=0.6)))
+
+    hashes = np.array(originals, dtype=np.uint64)
+    sources = np.array(sources)
+    # Расстояния до кадров других фото; кадры одного фото перекрываются и не считаются.
+    others = [hamming_distances(hashes, value)[sources != sources[i]] for i, value in enumerate(originals)]
+    pair_distances = np.concatenate(others)
+    nearest_other = np.array([row.min() if row.size else 64 for row in others])
+    copy_distances = np.array(
+        [hamming_distances(hashes[i : i + 1], copy)[0] if copy is not None else 64 for i, copy in enumerate(copies)]
+    )
+    report = [
+        {
+            "max_distance": d,
+            "false_match_rate": round(float(np.mean(pair_distances <= d)), 5),
+            "views_with_false_match": round(float(np.mean(nearest_other <= d)), 4),
+            "duplicate_recall": round(float(np.mean(copy_distances <= d)), 4),
+        }
+        for d in range(args.max_distance + 1)
+    ]
+    print(json.dumps({
+        "photos": len(images),
+        "views": len(images) * args.crops,
+        "rejected_degenerate": rejected,
+        "pairs": int(pair_distances.size) // 2,
+        "distances": report,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
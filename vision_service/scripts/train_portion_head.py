@@ -0,0 +1,76 @@
+"""Fit the portion-size head on photos with known weights.
+
+Usage: python -m vision_service.scripts.train_portion_head --images DIR --grams grams.csv --out portion_head.npz
+
+grams.csv has two columns, path relative to DIR and grams: ``borsch/1.jpg,350``.
+The head reads the embeddings of the configured backend, so retrain it after
+switching VISION_BACKEND or VISION_QUANTIZATION.
+"""
+
+import argparse
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+
+from ..heads import PortionHead
+from ..inference import _load_model
+from ..preprocessing import ImageRejected, preprocess
+from ..quantization import iter_batches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", required=True)
+    parser.add_argument("--grams", required=True)
+    parser.add_argument("--out", required=True, help="файл головы (VISION_PORTION_HEAD)")
+    parser.add_argument("--l2", type=float, default=1.0)
+    parser.add_argument("--holdout", type=float, default=0.2, help="доля фото для проверки")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = []
+    grams = []
+    with open(args.grams, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[1].strip():
+                continue
+            path = Path(args.images) / row[0].strip()
+            try:
+                # iter_batches пропускает битые файлы, поэтому проверяем их здесь,
+                # чтобы эмбеддинги и веса остались выровнены.
+                preprocess(path.read_bytes())
+            except (OSError, ImageRejected):
+                continue
+            paths.append(path)
+            grams.append(float(row[1]))
+    if len(paths) < 2:
+        raise SystemExit("Нужно хотя бы два фото с известным весом")
+
+    backend = _load_model().backend
+    embeddings = np.concatenate([backend(batch)[0].numpy() for batch in iter_batches(paths, args.batch_size)])
+    grams_arr = np.asarray(grams, dtype=np.float32)
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(paths))
+    n_holdout = int(len(paths) * args.holdout)
+    holdout, train = order[:n_holdout], order[n_holdout:]
+    head = PortionHead.fit(embeddings[train], grams_arr[train], l2=args.l2)
+    report = {"train": len(train), "holdout": len(holdout)}
+    if len(holdout):
+        errors = np.abs(head.predict(embeddings[holdout]) - grams_arr[holdout])
+        baseline = np.abs(np.median(grams_arr[train]) - grams_arr[holdout])
+        report.update(
+            mae_grams=round(float(errors.mean()), 1),
+            median_baseline_mae_grams=round(float(baseline.mean()), 1),
+        )
+    # Финальная голова учится на всех фото.
+    PortionHead.fit(embeddings, grams_arr, l2=args.l2).save(args.out)
+    report["out"] = args.out
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
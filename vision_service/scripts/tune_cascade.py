@@ -0,0 +1,97 @@
+"""Pick VISION_CASCADE_THRESHOLD: share answered by the fast model, its agreement with EfficientNet, latency.
+
+Usage:
+  python -m vision_service.scripts.tune_cascade --images DIR [--thresholds 0.2 0.3 0.5 0.7]
+
+Both models run once on every photo in DIR (jpg/png/webp). For each
+threshold the report gives the share of photos the fast model would answer,
+how often its top dish equals EfficientNet's on those photos, and the
+expected model time per photo: fast forward + share escalated x EfficientNet
+forward. Images rejected as blank or non-food are counted separately.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import torch
+
+from .. import config
+from ..inference import _load_model
+from ..preprocessing import CROP_SIZE, decode, to_tensor
+
+
+def _timed(fn, batch):
+    started = time.perf_counter()
+    output = fn(batch)
+    return output, (time.perf_counter() - started) / len(batch) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", required=True, help="каталог с фото блюд")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.2, 0.3, 0.4, 0.5, 0.6, 0.7])
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    names = sorted(n for n in os.listdir(args.images) if n.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    if not names:
+        raise SystemExit("В каталоге нет изображений")
+    # Порог любой положительный: нужен только сам факт загрузки быстрой модели.
+    config.CASCADE_THRESHOLD = max(config.CASCADE_THRESHOLD, 1e-6)
+    _load_model.cache_clear()
+    model = _load_model()
+    if model.fast_backend is None:
+        raise SystemExit("Быстрая модель недоступна")
+    projection = model.projections.current()
+
+    fast_conf, fast_top, food_mass, spread, full_top = [], [], [], [], []
+    fast_ms = full_ms = 0.0
+    for start in range(0, len(names), args.batch_size):
+        chunk = names[start : start + args.batch_size]
+        batch = torch.empty((len(chunk), 3, CROP_SIZE, CROP_SIZE), dtype=torch.float32)
+        for i, name in enumerate(chunk):
+            with open(os.path.join(args.images, name), "rb") as f:
+                to_tensor(decode(f.read()), out=batch[i])
+        (_, fast_logits), ms = _timed(model.fast_backend, batch)
+        fast_ms += ms * len(chunk)
+        (_, full_logits), ms = _timed(model.backend, batch)
+        full_ms += ms * len(chunk)
+        probs = torch.softmax(fast_logits, dim=-1)
+        scores = projection.scores(probs)
+        fast_conf += scores.max(dim=-1).values.tolist()
+        fast_top += scores.argmax(dim=-1).tolist()
+        food_mass += projection.food_mass(probs).tolist()
+        spread += batch.flatten(2).std(dim=2).amax(dim=1).tolist()
+        full_top += projection.scores(torch.softmax(full_logits, dim=-1)).argmax(dim=-1).tolist()
+
+    total = len(names)
+    fast_ms /= total
+    full_ms /= total
+    blank = [s < config.PREFILTER_BLANK_STD for s in spread]
+    report = []
+    for threshold in args.thresholds:
+        accepted = [not b and c >= threshold for b, c in zip(blank, fast_conf)]
+        nonfood = [not b and not a and m < config.CASCADE_NONFOOD_MASS for b, a, m in zip(blank, accepted, food_mass)]
+        escalated = total - sum(blank) - sum(accepted) - sum(nonfood)
+        agree = sum(1 for a, f, e in zip(accepted, fast_top, full_top) if a and f == e)
+        report.append({
+            "threshold": threshold,
+            "blank": round(sum(blank) / total, 3),
+            "nonfood": round(sum(nonfood) / total, 3),
+            "fast": round(sum(accepted) / total, 3),
+            "full": round(escalated / total, 3),
+            "fast_agreement": round(agree / sum(accepted), 3) if any(accepted) else None,
+            "model_ms_per_image": round(fast_ms + escalated / total * full_ms, 2),
+        })
+    print(json.dumps({
+        "images": total,
+        "fast_ms_per_image": round(fast_ms, 2),
+        "full_ms_per_image": round(full_ms, 2),
+        "thresholds": report,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Multi-process server: several uvicorn workers on one socket, one shared copy of the weights.
+
+Usage:
+  VISION_SERVER_WORKERS=4 python -m vision_service.serve [--host 0.0.0.0] [--port 8001]
+
+A short-lived child verifies the weights and writes the backend artifact
+once, then the parent spawns the workers. With ``VISION_SHARED_WEIGHTS`` (on by default for more
+than one worker) every worker memory-maps the same weights file, so the
+weights occupy the page cache once rather than once per process. Each
+worker runs torch with its own slice of the cores: ``VISION_TORCH_THREADS``
+threads, or the available cores split evenly; ``VISION_PIN_CPUS=1``
+additionally pins it to those cores.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from typing import List
+
+from . import config
+
+
+logger = logging.getLogger("vision_service")
+
+APP = "vision_service.app:app"
+
+
+def cpu_slices(workers: int, threads: int) -> List[List[int]]:
+    """Disjoint core sets, one per worker (they wrap around if there are fewer cores than threads)."""
+    cpus = sorted(os.sched_getaffinity(0))
+    per_worker = threads or max(1, len(cpus) // workers)
+    return [[cpus[(i * per_worker + j) % len(cpus)] for j in range(per_worker)] for i in range(workers)]
+
+
+def _prepare() -> None:
+    from .inference import prepare_artifacts
+
+    prepare_artifacts()
+
+
+def _serve_worker(uvicorn_config, index: int, cpus: List[int], sockets) -> None:
+    import uvicorn
+
+    # Процесс запущен через spawn: логирование uvicorn настраиваем заново.
+    uvicorn_config.configure_logging()
+    # Значения попадают и в config этого процесса, и в окружение spawn-воркеров пула инференса.
+    os.environ["VISION_TORCH_THREADS"] = str(len(cpus))
+    os.environ["OMP_NUM_THREADS"] = str(len(cpus))
+    config.TORCH_THREADS = len(cpus)
+    if config.PIN_CPUS:
+        os.sched_setaffinity(0, cpus)
+    logger.info("Воркер %s: pid=%s потоков torch=%s ядра=%s", index, os.getpid(), len(cpus), cpus if config.PIN_CPUS else "все")
+    uvicorn.Server(uvicorn_config).run(sockets=sockets)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+
+    # Подготовка в отдельном процессе: родителю незачем держать torch в памяти.
+    spawn = multiprocessing.get_context("spawn")
+    preparer = spawn.Process(target=_prepare, name="vision-prepare")
+    preparer.start()
+    preparer.join()
+    if preparer.exitcode != 0:
+        raise SystemExit("Не удалось подготовить модель")
+
+    uvicorn_config = uvicorn.Config(APP, host=args.host, port=args.port)
+    sock = uvicorn_config.bind_socket()
+    slices = cpu_slices(config.SERVER_WORKERS, config.TORCH_THREADS)
+    processes = []
+    for index, cpus in enumerate(slices):
+        # Слушающий сокет передаётся воркеру явно: spawn дублирует его дескриптор в дочерний процесс.
+        process = spawn.Process(
+            target=_serve_worker, args=(uvicorn_config, index, cpus, [sock]), name=f"vision-worker-{index}"
+        )
+        process.start()
+        processes.append(process)
+    logger.info(
+        "Запущено воркеров: %s, общие веса: %s, потоков torch на воркер: %s",
+        len(processes),
+        config.SHARED_WEIGHTS,
+        len(slices[0]),
+    )
+
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.set())
+    # Упавший воркер останавливает весь сервер: перезапуск — дело оркестратора.
+    while not stopping.wait(0.5):
+        if any(not process.is_alive() for process in processes):
+            logger.error("Воркер завершился, останавливаем сервер")
+            break
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,57 @@
-import json
-from pathlib import Path
-from typing import Dict
+import time
+from typing import Dict, List, Optional, Sequence
 
-from .inference import classify
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+from .batching import MicroBatcher
+from . import config
+from .inference import classify, classify_plate
+from .metrics import CASCADE_TIERS, STAGE_SECONDS
+from .nutrition import DEFAULT_PORTION_GRAMS, MACROS, NutritionStore
+from .phash import PerceptualIndex, dhash
+from .plate import merge_detections
 
 
 class NutritionService:
-    def __init__(self, db_path: Path):
-        self.db: Dict[str, Dict[str, float]] = json.loads(db_path.read_text(encoding="utf-8"))
-
-    def estimate_portion_grams(self) -> int:
-        return 200
-
-    def calc_macros(self, label: str, portion_grams: int) -> Dict[str, float]:
-        nutrition = self.db.get(label)
-        if not nutrition:
-            nutrition = next(iter(self.db.values()))
-        factor = portion_grams / 100
-        return {
-            "calories_kcal": round(nutrition["calories_kcal"] * factor, 1),
-            "proteins_g": round(nutrition["proteins_g"] * factor, 1),
-            "fats_g": round(nutrition["fats_g"] * factor, 1),
-            "carbs_g": round(nutrition["carbs_g"] * factor, 1),
-        }
+    def __init__(self, store: NutritionStore):
+        self.store = store
 
+    def estimate_portion_grams(self, label: Optional[str] = None) -> int:
+        table = self.store.current()
+        dish_id = table.lookup(label)
+        if dish_id is None:
+            return DEFAULT_PORTION_GRAMS
+        return int(table.portion_grams[dish_id])
 
-def estimate_meal(image_bytes: bytes, nutrition_service: NutritionService) -> Dict[str, float]:
-    label, confidence = classify(image_bytes)
-    portion_grams = nutrition_service.estimate_portion_grams()
+    def calc_macros(self, label: Optional[str], portion_grams: float) -> Dict[str, Optional[float]]:
+        return self.calc_macros_batch([label], [portion_grams])[0]
+
+    def calc_macros_batch(
+        self, labels: Sequence[Optional[str]], portions_grams: Sequence[float]
+    ) -> List[Dict[str, Optional[float]]]:
+        """Macros for many (dish, grams) pairs; unknown dishes and missing values give None."""
+        table = self.store.current()
+        ids = [table.lookup(label) for label in labels]
+        known = [i for i, dish_id in enumerate(ids) if dish_id is not None]
+        values = np.full((len(MACROS), len(ids)), np.nan, dtype=np.float32)
+        if known:
+            values[:, known] = table.macros(
+                [ids[i] for i in known], np.asarray(portions_grams, dtype=np.float32)[known]
+            )
+        return [
+            {name: (None if np.isnan(v) else round(v, 1)) for name, v in zip(MACROS, column)}
+            for column in values.T.tolist()
+        ]
+
+
+def build_estimate(prediction: Dict[str, object], nutrition_service: NutritionService) -> Dict[str, float]:
+    candidates = prediction.get("candidates") or []
+    top = candidates[0] if candidates else {}
+    label = top.get("name")
+    confidence = top.get("confidence")
+    # Оценка порции приходит из того же прямого прохода; без неё — стандартная порция блюда.
+    portion_grams = prediction.get("portion_grams") or nutrition_service.estimate_portion_grams(label)
     macros = nutrition_service.calc_macros(label, portion_grams)
     return {
         "label": label,
@@ -35,3 +59,68 @@ def estimate_meal(image_bytes: bytes, nutrition_service: NutritionService) -> Di
         "portion_grams_est": portion_grams,
         **macros,
     }
+
+
+def estimate_meal(image_bytes: bytes, nutrition_service: NutritionService) -> Dict[str, float]:
+    return build_estimate(classify(image_bytes), nutrition_service)
+
+
+async def estimate_meal_batched(
+    image_bytes: bytes,
+    nutrition_service: NutritionService,
+    batcher: MicroBatcher,
+    phash_index: Optional[PerceptualIndex] = None,
+) -> Dict[str, float]:
+    image_hash = None
+    if phash_index is not None and phash_index.capacity:
+        # Не в пуле модели: там хеш ждал бы целые батчи и был бы не виден admit().
+        image_hash = await run_in_threadpool(dhash, image_bytes)
+        if image_hash is not None:
+            # Пережатая или слегка изменённая копия недавнего фото — модель не запускаем.
+            cached = phash_index.lookup(image_hash)
+            if cached is not None:
+                return cached
+    prediction = await batcher.submit(image_bytes)
+    if prediction.get("tier"):
+        CASCADE_TIERS.inc(prediction["tier"])
+    started = time.perf_counter()
+    result = build_estimate(prediction, nutrition_service)
+    STAGE_SECONDS.observe(time.perf_counter() - started, "macros")
+    if image_hash is not None and prediction["candidates"]:
+        phash_index.add(image_hash, result)
+    return result
+
+
+def build_plate_estimate(detections: List[dict], nutrition_service: NutritionService) -> Dict[str, object]:
+    confident = [d for d in detections if d["confidence"] >= config.PLATE_MIN_CONFIDENCE]
+    items = merge_detections(confident, config.PLATE_NMS_IOU)
+    labels = [item["name"] for item in items]
+    portions = [item.get("portion_grams") or nutrition_service.estimate_portion_grams(item["name"]) for item in items]
+    # Макросы всех блюд тарелки — одной векторной операцией по таблице.
+    macros = nutrition_service.calc_macros_batch(labels, portions)
+    result_items = [
+        {
+            "label": item["name"],
+            "confidence": item["confidence"],
+            "box": [round(v, 3) for v in item["box"]],
+            "portion_grams_est": grams,
+            **item_macros,
+        }
+        for item, grams, item_macros in zip(items, portions, macros)
+    ]
+    totals = {}
+    for name in MACROS:
+        values = [m[name] for m in macros if m[name] is not None]
+        totals[name] = round(sum(values), 1) if values else None
+    return {"items": result_items, **totals}
+
+
+async def estimate_plate(
+    image_bytes: bytes,
+    nutrition_service: NutritionService,
+    batcher: MicroBatcher,
+) -> Dict[str, object]:
+    # Кропы одной тарелки уже составляют батч: с другими фото его не склеиваем,
+    # но очередь и слоты пула у него общие с микробатчером.
+    detections = await batcher.run(classify_plate, image_bytes, config.PLATE_GRID)
+    return build_plate_estimate(detections, nutrition_service)